@@ -1,63 +1,152 @@
 # bokeh serve --show Bokeh_practical_tasks.py
+# bokeh serve --show titanic_dashboard      (same app, data prepared once at server start)
 # kill -9 <pid>
+#
+# python Bokeh_practical_tasks.py --client-side
+#   writes standalone bokeh_plots/*.html whose filters run in the browser (no server needed)
+#   charts whose data, code and mode are unchanged since the last run are skipped (--force renders all)
+#
+# python Bokeh_practical_tasks.py --dashboard [--client-side]
+#   writes the three charts as one document with shared data and selectors (bokeh_plots/dashboard.html)
 
 
 import pandas as pd
 import numpy as np
 import os
+import sys
+from functools import partial
 from bokeh.io import show, curdoc
-from bokeh.models import ColumnDataSource, HoverTool, Select, FactorRange
+from bokeh.events import RangesUpdate
+from bokeh.models import (ColumnDataSource, HoverTool, Select, FactorRange, CDSView, BooleanFilter, IndexFilter, CustomJS,
+                          Range1d)
 from bokeh.layouts import column, row
 from bokeh.plotting import figure, output_file, save
 from bokeh.transform import factor_cmap
 
+import titanic_data
+from fare_lod import FareLodIndex, RAW_POINT_LIMIT
+from render_cache import RenderCache, frame_digest
+from instrumentation import span, traced
+from titanic_data import (prepare_data_for_processing, build_survival_cube, build_selection_rows, build_scatter_columns,
+                          age_group_survival_data, class_gender_data, selection_lookup, gender_option)
+
 script_dir = os.path.dirname(os.path.abspath(__file__))
 source_path = script_dir
 
-def prepare_data_for_processing():
-
-    #script_dir = os.path.dirname(os.path.abspath(__file__))
-    #source_path = script_dir + '/Titanic/'
-
-    df = pd.read_csv(source_path + '/Titanic/Titanic-Dataset.csv')
-
-    # Handle missing values
-    df['Age'].fillna(df['Age'].median(), inplace=True)
-    df['Cabin'].fillna('Unknown', inplace=True)
-    df['Embarked'].fillna('N/A', inplace=True)
-    #df.isna().sum()
-
-    df['AgeGroup'] = np.where(df['Age'] < 11, 'Child',
-                        np.where(df['Age'] < 20, 'Young Adult',
-                                np.where(df['Age'] < 60, 'Adult', 'Senior')
-                                )
-                            )
-
-    grouped_df = df.groupby(['Pclass', 'Sex', 'AgeGroup'])['Survived'].mean().reset_index()
-    #display(grouped_df)
-
-    grouped_df['SurvivalRate'] = (grouped_df['Survived'] * 100).round(2)
-
-    # Merge (grouped_df) with (df)
-    df_survived = pd.merge(df, grouped_df[['Pclass', 'Sex', 'AgeGroup', 'SurvivalRate']],
-                on=['Pclass', 'Sex', 'AgeGroup'], how='left')
-
-    return df_survived
+# Columns of the prepared Titanic frame each chart reads (the render cache hashes these)
+CHART_COLUMNS = {
+    'age_group_survival': ['Pclass', 'Sex', 'AgeGroup', 'Survived'],
+    'class_gender': ['Pclass', 'Sex', 'AgeGroup', 'Survived'],
+    'fare_vs_survival': titanic_data.SCATTER_COLUMNS,
+    'dashboard': titanic_data.DASHBOARD_COLUMNS,
+}
+
+
+# Positions where two equally long-or-shorter columns differ (NaN equals NaN)
+def _changed_positions(old, new):
+    n = min(len(old), len(new))
+    a, b = np.asarray(old[:n], dtype=object), np.asarray(new[:n], dtype=object)
+    if a.ndim == b.ndim == 1:
+        a_num, b_num = pd.to_numeric(pd.Series(a), errors='coerce'), pd.to_numeric(pd.Series(b), errors='coerce')
+        if not (a_num.isna() & pd.notna(a)).any() and not (b_num.isna() & pd.notna(b)).any():
+            a, b = a_num.to_numpy(), b_num.to_numpy()
+            return np.flatnonzero(~((a == b) | (np.isnan(a) & np.isnan(b))))
+    return np.array([i for i in range(n) if old[i] != new[i]], dtype=np.intp)
+
+
+# Send only what changed between the current and the new contents of a ColumnDataSource:
+# changed cells as source.patch, appended rows as source.stream. Shrinking sources, new column
+# sets or mostly-changed data fall back to replacing source.data.
+def update_source(source, new_data):
+    old_data = source.data
+    old_len = len(next(iter(old_data.values()), []))
+    new_len = len(next(iter(new_data.values()), []))
+    if set(old_data) != set(new_data) or new_len < old_len:
+        source.data = new_data
+        return
+
+    patches = {}
+    for name, new_values in new_data.items():
+        changed = _changed_positions(old_data[name], new_values)
+        if len(changed):
+            patches[name] = [(int(i), new_values[i]) for i in changed]
+    if sum(len(p) for p in patches.values()) > len(new_data) * old_len // 2:
+        source.data = new_data
+        return
+
+    if patches:
+        source.patch(patches)
+    if new_len > old_len:
+        source.stream({name: list(values[old_len:]) for name, values in new_data.items()})
+
+
+# Runs a chart's update off the server's Tornado IOLoop: compute(*args) goes to the process-wide
+# titanic_data.update_pool() and apply(result) comes back through doc.add_next_tick_callback,
+# as Bokeh requires for model changes. At most one computation per chart is in flight;
+# selections arriving meanwhile are coalesced, so after a burst of changes only the latest one
+# is computed and results that are already stale are dropped. Outside a server session (saved
+# files, benchmarks) it runs inline.
+class AsyncUpdater:
+    def __init__(self, compute, apply, doc=None):
+        self.compute = compute
+        self.apply = apply
+        self.doc = doc or curdoc()
+        self._pending = None
+        self._running = False
+
+    # Called on the document's thread (widget and range callbacks)
+    def request(self, *args):
+        if self.doc.session_context is None:
+            self.apply(self.compute(*args))
+            return
+        self._pending = args
+        if not self._running:
+            self._submit()
+
+    def _submit(self):
+        args, self._pending = self._pending, None
+        self._running = True
+        future = titanic_data.update_pool().submit(self.compute, *args)
+        future.add_done_callback(lambda done: self.doc.add_next_tick_callback(partial(self._finish, done)))
+
+    def _finish(self, future):
+        self._running = False
+        if self._pending is not None:  # a newer selection arrived meanwhile
+            self._submit()
+            return
+        self.apply(future.result())
+
+
+# Browser-side counterpart of update() for the aggregated charts: swap in the lookup entry
+LOOKUP_SELECTION_JS = """
+    const gender = gender_select.value == 'All' ? 'All' : gender_select.value.toLowerCase();
+    const data = lookup[class_select.value + '|' + gender];
+    source.data = Object.assign({}, data);
+    x_range.factors = data[factor_column];
+"""
+
+# Browser-side counterpart of update() for the row-level scatter: recompute the view's booleans
+FILTER_ROWS_JS = """
+    const selected_class = class_select.value;
+    const gender = gender_select.value.toLowerCase();
+    const pclass = source.data['Pclass'];
+    const sex = source.data['Sex'];
+    const booleans = new Array(pclass.length);
+    for (let i = 0; i < pclass.length; i++) {
+        booleans[i] = (selected_class == 'All' || String(pclass[i]) == selected_class) &&
+                      (gender == 'all' || sex[i] == gender);
+    }
+    view_filter.booleans = booleans;
+    source.change.emit();
+"""
 
 
 
 # Age Group Survival: Create a bar chart showing survival rates across different age groups.
-# Calculate survival rates for each AgeGroup
-def age_group_survival(df_survived):
-    age_group_survival = df_survived.groupby('AgeGroup')['Survived'].mean() * 100
-    age_group_survival = age_group_survival.reset_index()
-    age_group_survival['AgeGroup'] = age_group_survival['AgeGroup'].astype(str)
-
-    # Convert to ColumnDataSource for Bokeh
-    source = ColumnDataSource(age_group_survival)
-
+# Bar chart of a source with the columns of age_group_survival_data
+def _age_group_figure(source):
     # Figure craete
-    p = figure(x_range=age_group_survival['AgeGroup'].unique().tolist(), height=500, width=700,
+    p = figure(x_range=list(source.data['AgeGroup']), height=500, width=700,
             title="Survival Rates by Age Group", toolbar_location=None, tools="")
 
     # Add bars
@@ -74,48 +163,65 @@ def age_group_survival(df_survived):
     p.y_range.start = 0
     p.yaxis.axis_label = "Survival Rate (%)"
     p.xaxis.axis_label = "Age Group"
+    return p
 
-    # Create filtering widgets
-    class_select = Select(title="Passenger Class", value="All", options=["All", "1", "2", "3"])
-    gender_select = Select(title="Gender", value="All", options=["All", "male", "female"])
 
-    # Update function to filter data based on selection
-    def update():
-        selected_class = class_select.value
-        selected_gender = gender_select.value
+# Calculate survival rates for each AgeGroup
+@traced('render')
+def age_group_survival(df_survived, cube=None, client_side=False, serve=False):
+    cube = cube if cube is not None else build_survival_cube(df_survived)
+    age_group_survival = age_group_survival_data(cube, "All", "All")
 
-        # Filter df_survived based on the selected class and gender
-        filtered_df = df_survived.copy()
+    # Convert to ColumnDataSource for Bokeh
+    source = ColumnDataSource(age_group_survival)
+    p = _age_group_figure(source)
 
-        if selected_class != "All":
-            filtered_df = filtered_df[filtered_df['Pclass'] == int(selected_class)]
-        if selected_gender != "All":
-            filtered_df = filtered_df[filtered_df['Sex'] == selected_gender]
+    # Create filtering widgets
+    class_select = Select(title="Passenger Class", value="All", options=["All", "1", "2", "3"])
+    gender_select = Select(title="Gender", value="All", options=["All", "male", "female"])
 
-        # Recalculate the survival rates by AgeGroup with the filtered data
-        updated_age_group_survival = filtered_df.groupby('AgeGroup')['Survived'].mean() * 100
-        updated_age_group_survival = updated_age_group_survival.reset_index()
-        updated_age_group_survival['AgeGroup'] = updated_age_group_survival['AgeGroup'].astype(str)
+    # Look up the precomputed survival rates by AgeGroup for the selection (on the update pool)
+    @traced('update', name='age_group_survival.update')
+    def compute(selected_class, selected_gender):
+        return age_group_survival_data(cube, selected_class, selected_gender)
 
-        # Update the data source
-        source.data = ColumnDataSource(updated_age_group_survival).data
+    def apply(updated_age_group_survival):
+        # Update the data source, sending only the changed values
+        update_source(source, updated_age_group_survival)
 
         # Update the x_range of the plot to match the new data
-        p.x_range.factors = updated_age_group_survival['AgeGroup'].tolist()
+        p.x_range.factors = updated_age_group_survival['AgeGroup']
+
+    updater = AsyncUpdater(compute, apply)
 
-    # Attach the update function to the widgets
-    class_select.on_change('value', lambda attr, old, new: update())
-    gender_select.on_change('value', lambda attr, old, new: update())
+    # Update function to filter data based on selection
+    def update():
+        updater.request(class_select.value, gender_select.value)
+
+    # Attach the update function to the widgets (or its JavaScript counterpart)
+    if client_side:
+        callback = CustomJS(args=dict(source=source, x_range=p.x_range, class_select=class_select, gender_select=gender_select,
+                                      lookup=selection_lookup(cube, age_group_survival_data), factor_column='AgeGroup'),
+                            code=LOOKUP_SELECTION_JS)
+        class_select.js_on_change('value', callback)
+        gender_select.js_on_change('value', callback)
+    else:
+        class_select.on_change('value', lambda attr, old, new: update())
+        gender_select.on_change('value', lambda attr, old, new: update())
 
     # Arrange the layout
     layout = column(row(class_select, gender_select), p)
 
     curdoc().add_root(layout)  # Display the plot in a Bokeh server
+    if serve:
+        return layout
 
     output_file(source_path + "/bokeh_plots/age_group_survival.html")  # Specify the output file name
-    save(layout)  # Save the layout to the file
+    with span('save', 'write', chart='age_group_survival'):
+        save(layout)  # Save the layout to the file
 
     show(layout)   # For Jupyter Notebook or standalone script, use show(layout)
+    return layout
 
 
 
@@ -125,16 +231,8 @@ def age_group_survival(df_survived):
 
 ##########Class and Gender: Create a grouped bar chart to compare survival rates across
 ##########different classes (1st, 2nd, 3rd) and genders (male, female).
-# Calculate survival rates
-def class_gender(df_survived):
-    survival_rates = df_survived.groupby(['Pclass', 'Sex'])['Survived'].mean().unstack().reset_index()
-    survival_rates = pd.melt(survival_rates, id_vars=['Pclass'], value_vars=['male', 'female'], var_name='Sex', value_name='Survival_Rate')
-
-    # Prepare data for Bokeh
-    survival_rates['Pclass_Sex'] = list(zip(survival_rates['Pclass'].astype(str), survival_rates['Sex']))
-
-    source = ColumnDataSource(survival_rates)
-
+# Grouped bar chart of a source with the columns of class_gender_data
+def _class_gender_figure(source):
     # Define the factors for x-axis
     factors = [(str(cls), gender) for cls in [1, 2, 3] for gender in ['male', 'female']]
 
@@ -166,42 +264,62 @@ def class_gender(df_survived):
     p.yaxis.axis_label = 'Survival Rate'
     p.xaxis.axis_label = 'Class and Gender'
     p.xaxis.major_label_orientation = 1
+    return p
+
+
+# Calculate survival rates
+@traced('render')
+def class_gender(df_survived, cube=None, client_side=False, serve=False):
+    cube = cube if cube is not None else build_survival_cube(df_survived)
+    survival_rates = class_gender_data(cube, "All", "All")
+
+    source = ColumnDataSource(survival_rates)
+    p = _class_gender_figure(source)
 
     # Create filtering widgets
     class_select = Select(title="Passenger Class", value="All", options=["All", "1", "2", "3"])
     gender_select = Select(title="Gender", value="All", options=["All", "male", "female"])
 
-    # Update function to filter data based on selection
-    def update():
-        selected_class = class_select.value
-        selected_gender = gender_select.value
-
-        filtered_df = survival_rates.copy()
+    @traced('update', name='class_gender.update')
+    def compute(selected_class, selected_gender):
+        return class_gender_data(cube, selected_class, selected_gender)
 
-        if selected_class != "All":
-            filtered_df = filtered_df[filtered_df['Pclass'] == int(selected_class)]
-        if selected_gender != "All":
-            filtered_df = filtered_df[filtered_df['Sex'] == selected_gender]
-
-        # Update the source data
-        source.data = ColumnDataSource(filtered_df).data
+    def apply(filtered_rates):
+        # Update the source data, sending only the changed values
+        update_source(source, filtered_rates)
 
         # Update the factors in the x_range to match the filtered data
-        new_factors = [(str(cls), gender) for cls, gender in zip(filtered_df['Pclass'], filtered_df['Sex'])]
-        p.x_range.factors = new_factors
+        p.x_range.factors = filtered_rates['Pclass_Sex']
+
+    updater = AsyncUpdater(compute, apply)
 
-    # Attach the update function to the widgets
-    class_select.on_change('value', lambda attr, old, new: update())
-    gender_select.on_change('value', lambda attr, old, new: update())
+    # Update function to filter data based on selection
+    def update():
+        updater.request(class_select.value, gender_select.value)
+
+    # Attach the update function to the widgets (or its JavaScript counterpart)
+    if client_side:
+        callback = CustomJS(args=dict(source=source, x_range=p.x_range, class_select=class_select, gender_select=gender_select,
+                                      lookup=selection_lookup(cube, class_gender_data), factor_column='Pclass_Sex'),
+                            code=LOOKUP_SELECTION_JS)
+        class_select.js_on_change('value', callback)
+        gender_select.js_on_change('value', callback)
+    else:
+        class_select.on_change('value', lambda attr, old, new: update())
+        gender_select.on_change('value', lambda attr, old, new: update())
 
     layout = column(row(class_select, gender_select), p)   # Arrange the layout
 
     curdoc().add_root(layout)    # Display the plot in a Bokeh server
+    if serve:
+        return layout
 
     output_file(source_path + "/bokeh_plots/class_gender.html")  # Specify the output file name
-    save(layout)  # Save the layout to the file
+    with span('save', 'write', chart='class_gender'):
+        save(layout)  # Save the layout to the file
 
     show(layout)    # For Jupyter Notebook, use show(layout)
+    return layout
 
 
 
@@ -212,22 +330,19 @@ def class_gender(df_survived):
 
 #Fare vs. Survival: Create a scatter plot with Fare on the x-axis and survival status
 #on the y-axis, using different colors to represent different classes.
-def fare_vs_survival(df_survived):
-    # Convert 'Pclass' to str
-    df_survived['Pclass'] = df_survived['Pclass'].astype(str)
-
-    # Create a ColumnDataSource
-    source = ColumnDataSource(df_survived)
-
+# Scatter of a row-level source through view; in LOD mode the source holds FareLodIndex points
+def _fare_figure(source, view, lod=False, lod_index=None):
     # Create a color mapping for classes
     color_map = factor_cmap('Pclass', palette=['blue', 'green', 'red'], factors=['1', '2', '3'])
 
-    # Create the figure
+    # Create the figure (fixed ranges in LOD mode, the data there changes with the viewport)
+    ranges = dict(x_range=Range1d(lod_index.fare_min, lod_index.fare_max), y_range=Range1d(-0.5, 1.5)) if lod else {}
     p = figure(width=800, height=400, title="Scatter Plot of Fare vs Survival Status by Class",
-            x_axis_label="Fare", y_axis_label="Survived", tools="pan,box_zoom,reset,save")
+            x_axis_label="Fare", y_axis_label="Survived", tools="pan,box_zoom,reset,save", **ranges)
 
     # Add the scatter plot
-    p.scatter(x='Fare', y='Survived', size=10, color=color_map, legend_field='Pclass', source=source, fill_alpha=0.4)
+    p.scatter(x='Fare', y='Survived', size='size' if lod else 10, color=color_map, legend_field='Pclass',
+              source=source, view=view, fill_alpha=0.4)
 
     # Add hover tool
     hover = HoverTool()
@@ -239,54 +354,268 @@ def fare_vs_survival(df_survived):
         ("Age", "@Age"),
         ("Name", "@Name")
     ]
+    if lod:
+        hover.tooltips.append(("Passengers", "@count"))
     p.add_tools(hover)
 
     p.legend.title = 'Class'
     p.legend.location = 'top_right'
+    return p
+
+
+@traced('render')
+def fare_vs_survival(df_survived, client_side=False, serve=False, columns=None, selection_rows=None,
+                     lod=None, lod_index=None):
+    # Column arrays (with 'Pclass' as str) and row positions per selection are computed once,
+    # not per widget change; df_survived itself is never modified
+    columns = columns if columns is not None else build_scatter_columns(df_survived)
+    selection_rows = selection_rows if selection_rows is not None else build_selection_rows(df_survived)
+    n_rows = len(next(iter(columns.values())))
+
+    # Level-of-detail mode (server only): the source holds binned points for the current viewport
+    # and raw rows only once the user zoomed in to fewer than RAW_POINT_LIMIT passengers
+    if lod is None:
+        lod = n_rows > RAW_POINT_LIMIT
+    lod = lod and not client_side
+    if lod:
+        lod_index = lod_index if lod_index is not None else FareLodIndex(columns, selection_rows)
 
-    # Filter function to update data based on user selection
-    def update():
-        selected_class = class_select.value
-        selected_gender = gender_select.value
+    # Create a ColumnDataSource
+    source = ColumnDataSource(data=lod_index.query(("All", "All")) if lod else dict(columns))
+
+    # All rows are shipped once and filtered through a view: in client-side mode the browser
+    # recomputes its booleans, on the server only the list of selected row indices is sent
+    view_filter = BooleanFilter(booleans=[True] * n_rows) if client_side else IndexFilter(indices=list(range(n_rows)))
+    view = CDSView(filter=view_filter) if not lod else CDSView()
 
-        filtered_df = df_survived.copy()
-        if selected_class != "All":
-            filtered_df = filtered_df[filtered_df['Pclass'] == selected_class]
-        if selected_gender != "All":
-            filtered_df = filtered_df[filtered_df['Sex'] == selected_gender.lower()]
+    p = _fare_figure(source, view, lod, lod_index)
 
-        # Update the source data with filtered data
-        source.data = ColumnDataSource(filtered_df).data
+    # Filter function to update data based on user selection (runs on the update pool)
+    @traced('update', name='fare_vs_survival.update')
+    def compute(selection, viewport):
+        if lod:
+            # Points for the current viewport from the multi-resolution index
+            return lod_index.query(selection, *viewport)
+        return selection_rows[selection].tolist()
+
+    def apply(result):
+        if lod:
+            source.data = result
+        else:
+            # Index-only update: the rows themselves are already in the browser
+            view_filter.indices = result
+
+    updater = AsyncUpdater(compute, apply)
+
+    def update():
+        selection = (class_select.value, gender_option(gender_select.value))
+        updater.request(selection, (p.x_range.start, p.x_range.end, p.y_range.start, p.y_range.end))
 
     # Create filter widgets
     class_select = Select(title="Passenger Class", value="All", options=["All", "1", "2", "3"])
     gender_select = Select(title="Gender", value="All", options=["All", "Male", "Female"])
 
-    # Call update() when the filter values change
-    class_select.on_change('value', lambda attr, old, new: update())
-    gender_select.on_change('value', lambda attr, old, new: update())
+    # Call update() (or its JavaScript counterpart) when the filter values change
+    if client_side:
+        callback = CustomJS(args=dict(source=source, view_filter=view_filter,
+                                      class_select=class_select, gender_select=gender_select),
+                            code=FILTER_ROWS_JS)
+        class_select.js_on_change('value', callback)
+        gender_select.js_on_change('value', callback)
+    else:
+        class_select.on_change('value', lambda attr, old, new: update())
+        gender_select.on_change('value', lambda attr, old, new: update())
+
+    # One RangesUpdate per pan/zoom/reset (rather than separate start/end changes) re-queries the index
+    if lod:
+        p.on_event(RangesUpdate, lambda event: update())
 
     # Arrange the layout
     layout = column(row(class_select, gender_select), p)
 
     curdoc().add_root(layout)      # Display the plot in a Bokeh server
+    if serve:
+        return layout
 
     output_file(source_path + "/bokeh_plots/fare_vs_survival.html")  # Specify the output file name
-    save(layout)  # Save the layout to the file
+    with span('save', 'write', chart='fare_vs_survival'):
+        save(layout)  # Save the layout to the file
 
     show(layout)      # For Jupyter Notebook or standalone script, use show(layout)
+    return layout
+
+
+
+
+
+# Browser-side update of the dashboard: filter the shared rows and aggregate the filtered rows
+# into the two small bar chart sources (same output as age_group_survival_data/class_gender_data)
+DASHBOARD_JS = """
+    const selected_class = class_select.value;
+    const gender = gender_select.value;
+    const data = rows.data;
+    const pclass = data['Pclass'], sex = data['Sex'], age_group = data['AgeGroup'], survived = data['Survived'];
+    const booleans = new Array(pclass.length);
+    const by_age = {}, by_class_gender = {};
+    for (let i = 0; i < pclass.length; i++) {
+        const keep = (selected_class == 'All' || String(pclass[i]) == selected_class) &&
+                     (gender == 'All' || sex[i] == gender);
+        booleans[i] = keep;
+        if (!keep) continue;
+        const a = by_age[age_group[i]] = by_age[age_group[i]] || [0, 0];
+        const key = String(pclass[i]) + '|' + sex[i];
+        const c = by_class_gender[key] = by_class_gender[key] || [0, 0];
+        a[0] += survived[i]; a[1] += 1;
+        c[0] += survived[i]; c[1] += 1;
+    }
+    view_filter.booleans = booleans;
+    rows.change.emit();
+
+    const present = age_groups.filter(group => group in by_age);
+    age_source.data = {AgeGroup: present, Survived: present.map(group => by_age[group][0] / by_age[group][1] * 100)};
+    age_range.factors = present;
+
+    const classes = selected_class == 'All' ? ['1', '2', '3'] : [selected_class];
+    const genders = gender == 'All' ? ['male', 'female'] : [gender];
+    const cg = {Pclass: [], Sex: [], Survival_Rate: [], Pclass_Sex: []};
+    for (const cls of classes) {
+        for (const g of genders) {
+            const counts = by_class_gender[cls + '|' + g];
+            cg.Pclass.push(Number(cls));
+            cg.Sex.push(g);
+            cg.Survival_Rate.push(counts ? counts[0] / counts[1] : NaN);
+            cg.Pclass_Sex.push([cls, g]);
+        }
+    }
+    class_gender_source.data = cg;
+    class_gender_range.factors = cg.Pclass_Sex;
+"""
+
+
+# Dashboard: the three charts in one document, driven by a single pair of Class/Gender
+# selectors. The passenger rows are serialized once, into the one row-level source of the
+# scatter; the bar charts only hold their few aggregated bars. In client-side mode they are
+# re-aggregated from the shared rows in the browser (no lookup tables are shipped), on the
+# server they are looked up in the survival cube.
+@traced('render')
+def dashboard(df_survived, cube=None, client_side=False, serve=False, columns=None, selection_rows=None,
+              lod=None, lod_index=None):
+    cube = cube if cube is not None else build_survival_cube(df_survived)
+    if columns is None:
+        columns = build_scatter_columns(df_survived, titanic_data.DASHBOARD_COLUMNS if client_side else None)
+    selection_rows = selection_rows if selection_rows is not None else build_selection_rows(df_survived)
+    n_rows = len(next(iter(columns.values())))
+
+    if lod is None:
+        lod = n_rows > RAW_POINT_LIMIT
+    lod = lod and not client_side
+    if lod:
+        lod_index = lod_index if lod_index is not None else FareLodIndex(columns, selection_rows)
+
+    # The single row-level source and its view
+    rows = ColumnDataSource(data=lod_index.query(("All", "All")) if lod else dict(columns))
+    view_filter = BooleanFilter(booleans=[True] * n_rows) if client_side else IndexFilter(indices=list(range(n_rows)))
+    fare_plot = _fare_figure(rows, CDSView(filter=view_filter) if not lod else CDSView(), lod, lod_index)
+
+    age_source = ColumnDataSource(age_group_survival_data(cube, "All", "All"))
+    age_plot = _age_group_figure(age_source)
+    class_gender_source = ColumnDataSource(class_gender_data(cube, "All", "All"))
+    class_gender_plot = _class_gender_figure(class_gender_source)
+
+    # One pair of selectors for all three charts
+    class_select = Select(title="Passenger Class", value="All", options=list(titanic_data.CLASS_OPTIONS))
+    gender_select = Select(title="Gender", value="All", options=list(titanic_data.GENDER_OPTIONS))
+
+    # All three views are computed together on the update pool and applied in one tick
+    @traced('update', name='dashboard.update')
+    def compute(selection, viewport):
+        rows_result = lod_index.query(selection, *viewport) if lod else selection_rows[selection].tolist()
+        return rows_result, age_group_survival_data(cube, *selection), class_gender_data(cube, *selection)
+
+    def apply(result):
+        rows_result, age_data, class_gender_rates = result
+        if lod:
+            rows.data = rows_result
+        else:
+            view_filter.indices = rows_result
+
+        update_source(age_source, age_data)
+        age_plot.x_range.factors = age_data['AgeGroup']
+
+        update_source(class_gender_source, class_gender_rates)
+        class_gender_plot.x_range.factors = class_gender_rates['Pclass_Sex']
+
+    updater = AsyncUpdater(compute, apply)
 
-
+    def update():
+        selection = (class_select.value, gender_option(gender_select.value))
+        viewport = (fare_plot.x_range.start, fare_plot.x_range.end, fare_plot.y_range.start, fare_plot.y_range.end)
+        updater.request(selection, viewport)
+
+    if client_side:
+        callback = CustomJS(args=dict(rows=rows, view_filter=view_filter, age_groups=cube['age_groups'],
+                                      age_source=age_source, age_range=age_plot.x_range,
+                                      class_gender_source=class_gender_source, class_gender_range=class_gender_plot.x_range,
+                                      class_select=class_select, gender_select=gender_select),
+                            code=DASHBOARD_JS)
+        class_select.js_on_change('value', callback)
+        gender_select.js_on_change('value', callback)
+    else:
+        class_select.on_change('value', lambda attr, old, new: update())
+        gender_select.on_change('value', lambda attr, old, new: update())
+    if lod:
+        fare_plot.on_event(RangesUpdate, lambda event: update())
+
+    layout = column(row(class_select, gender_select), row(age_plot, class_gender_plot), fare_plot)
+
+    curdoc().add_root(layout)
+    if serve:
+        return layout
+
+    output_file(source_path + "/bokeh_plots/dashboard.html", title="Titanic survival dashboard")
+    with span('save', 'write', chart='dashboard'):
+        save(layout)
+
+    show(layout)
+    return layout
+
+
+# Build the charts of one `bokeh serve` session from the process-wide shared data, so a new
+# session neither re-reads the CSV nor copies the frame: the three separate charts, or with
+# as_dashboard=True (`bokeh serve Bokeh_practical_tasks.py --args --dashboard`) the dashboard
+def serve_document(as_dashboard=False):
+    df_survived = titanic_data.shared_frame()
+    survival_cube = titanic_data.shared_survival_cube()
+    if as_dashboard:
+        dashboard(df_survived, survival_cube, serve=True, columns=titanic_data.shared_scatter_columns(),
+                  selection_rows=titanic_data.shared_selection_rows(), lod_index=titanic_data.shared_fare_lod())
+        return
+    age_group_survival(df_survived, survival_cube, serve=True)
+    class_gender(df_survived, survival_cube, serve=True)
+    fare_vs_survival(df_survived, serve=True, columns=titanic_data.shared_scatter_columns(),
+                     selection_rows=titanic_data.shared_selection_rows(), lod_index=titanic_data.shared_fare_lod())
 
 
 if __name__ == "__main__":
-    prepare_data_for_processing()
     df_survived = prepare_data_for_processing()
-    age_group_survival(df_survived)
-    class_gender(df_survived)
-    fare_vs_survival(df_survived)
-
-
-
-
-
+    client_side = '--client-side' in sys.argv[1:]
+    force = '--force' in sys.argv[1:]
+    survival_cube = build_survival_cube(df_survived)
+    if '--dashboard' in sys.argv[1:]:
+        charts = {'dashboard': lambda: dashboard(df_survived, survival_cube, client_side=client_side)}
+    else:
+        charts = {
+            'age_group_survival': lambda: age_group_survival(df_survived, survival_cube, client_side=client_side),
+            'class_gender': lambda: class_gender(df_survived, survival_cube, client_side=client_side),
+            'fare_vs_survival': lambda: fare_vs_survival(df_survived, client_side=client_side),
+        }
+    cache = RenderCache(source_path + "/bokeh_plots/")
+    for name, render in charts.items():
+        key = cache.key(globals()[name], frame_digest(df_survived, CHART_COLUMNS[name]), {'client_side': client_side})
+        if not force and cache.fresh(name, key):
+            print(f'{name}: unchanged')
+            continue
+        render()
+        cache.record(name, key, [name + '.html'])
+elif __name__.startswith('bokeh_app_'):  # executed by `bokeh serve Bokeh_practical_tasks.py` for every session
+    serve_document(as_dashboard='--dashboard' in sys.argv[1:])
@@ -0,0 +1,441 @@
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from data_schema import as_datetime, categories_for, encode
+from instrumentation import traced
+from spatial_index import GridIndex
+
+
+# Numeric columns summarised in every (neighbourhood_group, room_type) cell of the cube
+CUBE_MEASURES = ['price', 'availability_365', 'number_of_reviews']
+CUBE_COLUMNS = ['neighbourhood_group', 'room_type'] + CUBE_MEASURES  # what build_cube reads
+
+# Fixed bin edges of the quantile sketch: unit-wide bins up to 1024 (exact for the integer
+# prices, availabilities and review counts of the dataset) and log-spaced bins above that.
+# Because the edges never change, sketches of different chunks or files can simply be added.
+SKETCH_EDGES = np.concatenate([np.arange(0, 1024, dtype=np.float64), np.geomspace(1024, 1e7, 257)])
+SKETCH_VALUES = np.concatenate([SKETCH_EDGES[:1024], np.sqrt(SKETCH_EDGES[1024:-1] * SKETCH_EDGES[1025:])])
+SKETCH_BINS = len(SKETCH_VALUES)
+
+# Bins of the joint price x availability_365 histogram: price in 18 log-spaced bins from 10 to
+# 10000 (one more bin below 10, prices above 10000 go to the last bin) and availability in
+# a bin of its own for 0 days (unavailable listings) plus twelve ~monthly bins
+PRICE_BIN_EDGES = np.concatenate([[0], np.geomspace(10, 10000, 19)])
+AVAILABILITY_BIN_EDGES = np.array([0, 1, 31, 61, 91, 121, 151, 181, 211, 241, 271, 301, 331, 366])
+JOINT_SHAPE = (len(PRICE_BIN_EDGES) - 1, len(AVAILABILITY_BIN_EDGES) - 1)
+
+
+# Codes and labels of a schema column in the data_schema order. Categories without any row
+# (e.g. NYC boroughs in another city's dump) are left out, so no empty cells are plotted.
+def _codes_and_labels(series):
+    series = encode(series.name, series)
+    codes, labels = series.cat.codes.to_numpy(), list(series.cat.categories)
+    present = np.bincount(codes[codes >= 0], minlength=len(labels)) > 0
+    if present.all():
+        return codes, labels
+    remap = np.cumsum(present) - 1
+    codes = np.where(codes >= 0, remap[np.maximum(codes, 0)], -1)
+    return codes, [label for label, keep in zip(labels, present) if keep]
+
+
+def sketch_bins(values):
+    bins = np.searchsorted(SKETCH_EDGES, values, side='right') - 1
+    return np.clip(bins, 0, SKETCH_BINS - 1)
+
+
+# Flat (price bin, availability bin) index of every listing, see JOINT_SHAPE
+def joint_bins(price, availability):
+    p = np.clip(np.searchsorted(PRICE_BIN_EDGES, price, side='right') - 1, 0, JOINT_SHAPE[0] - 1)
+    a = np.clip(np.searchsorted(AVAILABILITY_BIN_EDGES, availability, side='right') - 1, 0, JOINT_SHAPE[1] - 1)
+    return p * JOINT_SHAPE[1] + a
+
+
+# Value at quantile q of a binned distribution, interpolated like np.percentile (linear)
+def _sketch_quantile(hist, cumulative, q):
+    position = q * (cumulative[-1] - 1)
+    lower = SKETCH_VALUES[np.searchsorted(cumulative, np.floor(position), side='right')]
+    upper = SKETCH_VALUES[np.searchsorted(cumulative, np.ceil(position), side='right')]
+    return lower + (upper - lower) * (position - np.floor(position))
+
+
+# Count, sum, sum of squares, min/max and a quantile sketch of CUBE_MEASURES and the joint
+# price x availability_365 histogram for every (neighbourhood_group, room_type) cell. All the
+# bar, box, heatmap and stacked plots read from this instead of grouping the raw listings.
+class AggregateCube:
+    def __init__(self, groups, room_types, count, sums, sumsq, mins, maxs, sketch, sum_xy, joint):
+        self.groups = list(groups)          # neighbourhood_group labels (axis 0)
+        self.room_types = list(room_types)  # room_type labels (axis 1)
+        self.count = count                  # (G, R)
+        self.sums = sums                    # (M, G, R)  M = len(CUBE_MEASURES)
+        self.sumsq = sumsq                  # (M, G, R)
+        self.mins = mins                    # (M, G, R), +inf in empty cells
+        self.maxs = maxs                    # (M, G, R), -inf in empty cells
+        self.sketch = sketch                # (M, G, R, SKETCH_BINS) counts
+        self.sum_xy = sum_xy                # (G, R) sum of price * number_of_reviews
+        self.joint = joint                  # (G, R, P, A) counts per price x availability bin
+
+    @classmethod
+    def empty(cls, groups, room_types):
+        shape = (len(groups), len(room_types))
+        measures = (len(CUBE_MEASURES),) + shape
+        return cls(groups, room_types,
+                   count=np.zeros(shape, dtype=np.int64),
+                   sums=np.zeros(measures),
+                   sumsq=np.zeros(measures),
+                   mins=np.full(measures, np.inf),
+                   maxs=np.full(measures, -np.inf),
+                   sketch=np.zeros(measures + (SKETCH_BINS,), dtype=np.int64),
+                   sum_xy=np.zeros(shape),
+                   joint=np.zeros(shape + JOINT_SHAPE, dtype=np.int64))
+
+    # Re-index the cube onto a (super)set of group and room type labels
+    def reindex(self, groups, room_types):
+        out = AggregateCube.empty(groups, room_types)
+        gi = np.array([groups.index(g) for g in self.groups], dtype=np.intp)
+        ri = np.array([room_types.index(r) for r in self.room_types], dtype=np.intp)
+        cells = np.ix_(gi, ri)
+        out.count[cells] = self.count
+        out.sum_xy[cells] = self.sum_xy
+        out.joint[cells] = self.joint
+        for m in range(len(CUBE_MEASURES)):
+            out.sums[m][cells] = self.sums[m]
+            out.sumsq[m][cells] = self.sumsq[m]
+            out.mins[m][cells] = self.mins[m]
+            out.maxs[m][cells] = self.maxs[m]
+            out.sketch[m][cells] = self.sketch[m]
+        return out
+
+    # Combine the aggregates of two disjoint sets of listings (chunks, files, cities)
+    def merge(self, other):
+        groups = self.groups + [g for g in other.groups if g not in self.groups]
+        room_types = self.room_types + [r for r in other.room_types if r not in self.room_types]
+        a = self if (groups, room_types) == (self.groups, self.room_types) else self.reindex(groups, room_types)
+        b = other if (groups, room_types) == (other.groups, other.room_types) else other.reindex(groups, room_types)
+        return AggregateCube(groups, room_types,
+                             count=a.count + b.count,
+                             sums=a.sums + b.sums,
+                             sumsq=a.sumsq + b.sumsq,
+                             mins=np.minimum(a.mins, b.mins),
+                             maxs=np.maximum(a.maxs, b.maxs),
+                             sketch=a.sketch + b.sketch,
+                             sum_xy=a.sum_xy + b.sum_xy,
+                             joint=a.joint + b.joint)
+
+    # Remove the aggregates of a subset of the listings (e.g. the rows a new snapshot dropped or
+    # changed). Counts, sums and sketches are exact (all measures are integers, so the float64
+    # sums carry no rounding). A minimum or maximum cannot be undone: it is kept, and the
+    # (G, R) mask of cells where `other` reached it is returned for recomputation.
+    def subtract(self, other):
+        unknown = (set(other.groups) - set(self.groups)) | (set(other.room_types) - set(self.room_types))
+        if unknown:
+            raise ValueError('Cannot subtract listings of unknown cells: ' + ', '.join(sorted(unknown)))
+        b = other if (other.groups, other.room_types) == (self.groups, self.room_types) else other.reindex(self.groups, self.room_types)
+        if (b.count > self.count).any():
+            raise ValueError('Cannot subtract more listings than the cube holds')
+        out = AggregateCube(self.groups, self.room_types,
+                            count=self.count - b.count,
+                            sums=self.sums - b.sums,
+                            sumsq=self.sumsq - b.sumsq,
+                            mins=self.mins.copy(),
+                            maxs=self.maxs.copy(),
+                            sketch=self.sketch - b.sketch,
+                            sum_xy=self.sum_xy - b.sum_xy,
+                            joint=self.joint - b.joint)
+        empty = out.count == 0
+        out.mins[:, empty] = np.inf
+        out.maxs[:, empty] = -np.inf
+        stale = ((b.mins <= self.mins) | (b.maxs >= self.maxs)).any(axis=0) & (b.count > 0) & ~empty
+        return out, stale
+
+    # Drop groups and room types without listings and put the labels into data_schema order,
+    # as build_cube would have produced them for the same listings
+    def compact(self):
+        gi = [self.groups.index(g) for g in categories_for('neighbourhood_group', self.groups)
+              if g in self.groups and self.count[self.groups.index(g)].any()]
+        ri = [self.room_types.index(r) for r in categories_for('room_type', self.room_types)
+              if r in self.room_types and self.count[:, self.room_types.index(r)].any()]
+        cells = np.ix_(gi, ri)
+        return AggregateCube([self.groups[g] for g in gi], [self.room_types[r] for r in ri],
+                             count=self.count[cells],
+                             sums=self.sums[(slice(None),) + cells],
+                             sumsq=self.sumsq[(slice(None),) + cells],
+                             mins=self.mins[(slice(None),) + cells],
+                             maxs=self.maxs[(slice(None),) + cells],
+                             sketch=self.sketch[(slice(None),) + cells],
+                             sum_xy=self.sum_xy[cells],
+                             joint=self.joint[cells])
+
+    def _frame(self, values):
+        return pd.DataFrame(values, index=pd.Index(self.groups, name='neighbourhood_group'),
+                            columns=pd.Index(self.room_types, name='room_type'))
+
+    # Number of listings per neighbourhood_group (by=None gives the full G x R table)
+    def counts(self, by='neighbourhood_group'):
+        table = self._frame(self.count)
+        return table.sum(axis=1) if by == 'neighbourhood_group' else table
+
+    def total(self, measure, by=None):
+        table = self._frame(self.sums[CUBE_MEASURES.index(measure)])
+        return table.sum(axis=1) if by == 'neighbourhood_group' else table
+
+    def mean(self, measure, by=None):
+        m = CUBE_MEASURES.index(measure)
+        if by == 'neighbourhood_group':
+            return pd.Series(self.sums[m].sum(axis=1), index=self.counts().index) / self.counts()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self._frame(self.sums[m] / self.count)
+
+    # Sample standard deviation (ddof=1, like DataFrame.std) per cell
+    def std(self, measure, ddof=1):
+        m = CUBE_MEASURES.index(measure)
+        n = self.count.astype(np.float64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            var = (self.sumsq[m] - self.sums[m] ** 2 / n) / (n - ddof)
+        return self._frame(np.sqrt(np.maximum(var, 0)))
+
+    def minimum(self, measure):
+        return self._frame(self.mins[CUBE_MEASURES.index(measure)])
+
+    def maximum(self, measure):
+        return self._frame(self.maxs[CUBE_MEASURES.index(measure)])
+
+    # Least-squares line of number_of_reviews against price per room type, as np.polyfit(x, y, 1)
+    def regression(self):
+        p, r = CUBE_MEASURES.index('price'), CUBE_MEASURES.index('number_of_reviews')
+        n = self.count.sum(axis=0).astype(np.float64)
+        sx, sy = self.sums[p].sum(axis=0), self.sums[r].sum(axis=0)
+        sxx, sxy = self.sumsq[p].sum(axis=0), self.sum_xy.sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            slope = (n * sxy - sx * sy) / (n * sxx - sx ** 2)
+            intercept = (sy - slope * sx) / n
+        return pd.DataFrame({'slope': slope, 'intercept': intercept}, index=pd.Index(self.room_types, name='room_type'))
+
+    # (P, A) counts of the price x availability_365 histogram of one neighbourhood_group
+    # (all groups if None), summed over the room types
+    def price_availability(self, group=None):
+        joint = self.joint if group is None else self.joint[self.groups.index(group)]
+        return joint.reshape((-1,) + JOINT_SHAPE).sum(axis=0)
+
+    # Box plot statistics per neighbourhood_group in the format expected by Axes.bxp
+    def box_stats(self, measure, whis=1.5):
+        m = CUBE_MEASURES.index(measure)
+        stats = []
+        for g, label in enumerate(self.groups):
+            hist = self.sketch[m, g].sum(axis=0)
+            if not hist.any():
+                continue
+            cumulative = np.cumsum(hist)
+            q1, med, q3 = (_sketch_quantile(hist, cumulative, q) for q in (0.25, 0.5, 0.75))
+            iqr = q3 - q1
+            present = SKETCH_VALUES[hist > 0]
+            inside = present[(present >= q1 - whis * iqr) & (present <= q3 + whis * iqr)]
+            stats.append({
+                'label': label,
+                'med': med, 'q1': q1, 'q3': q3,
+                'whislo': inside.min() if len(inside) else q1,
+                'whishi': inside.max() if len(inside) else q3,
+                'fliers': present[(present < q1 - whis * iqr) | (present > q3 + whis * iqr)],
+            })
+        return stats
+
+
+# Build the cube in one vectorized pass over the listings: every row is mapped to a flat
+# cell index once and all statistics are accumulated with np.bincount / ufunc.at.
+@traced('transform')
+def build_cube(df):
+    g_codes, groups = _codes_and_labels(df['neighbourhood_group'])
+    r_codes, room_types = _codes_and_labels(df['room_type'])
+    cube = AggregateCube.empty(groups, room_types)
+    n_cells = len(groups) * len(room_types)
+
+    valid = (g_codes >= 0) & (r_codes >= 0)
+    cell = (g_codes.astype(np.intp) * len(room_types) + r_codes)[valid]
+    shape = cube.count.shape
+
+    cube.count[:] = np.bincount(cell, minlength=n_cells).reshape(shape)
+    for m, measure in enumerate(CUBE_MEASURES):
+        values = df[measure].to_numpy(dtype=np.float64)[valid]
+        cube.sums[m] = np.bincount(cell, weights=values, minlength=n_cells).reshape(shape)
+        cube.sumsq[m] = np.bincount(cell, weights=values * values, minlength=n_cells).reshape(shape)
+        np.minimum.at(cube.mins[m].reshape(-1), cell, values)
+        np.maximum.at(cube.maxs[m].reshape(-1), cell, values)
+        binned = cell * SKETCH_BINS + sketch_bins(values)
+        cube.sketch[m] = np.bincount(binned, minlength=n_cells * SKETCH_BINS).reshape(shape + (SKETCH_BINS,))
+
+    price = df['price'].to_numpy(dtype=np.float64)[valid]
+    reviews = df['number_of_reviews'].to_numpy(dtype=np.float64)[valid]
+    cube.sum_xy[:] = np.bincount(cell, weights=price * reviews, minlength=n_cells).reshape(shape)
+
+    availability = df['availability_365'].to_numpy(dtype=np.float64)[valid]
+    n_joint = JOINT_SHAPE[0] * JOINT_SHAPE[1]
+    binned = cell * n_joint + joint_bins(price, availability)
+    cube.joint[:] = np.bincount(binned, minlength=n_cells * n_joint).reshape(shape + JOINT_SHAPE)
+    return cube
+
+
+# Price x availability_365 histogram of every neighbourhood (label -> (P, A) counts), binned
+# like AggregateCube.joint with one np.bincount over (neighbourhood, joint bin) codes
+@traced('transform')
+def build_neighbourhood_price_availability(df):
+    hood = pd.Categorical(df['neighbourhood'])
+    codes = hood.codes.astype(np.intp)
+    valid = codes >= 0
+    n_joint = JOINT_SHAPE[0] * JOINT_SHAPE[1]
+    binned = codes[valid] * n_joint + joint_bins(df['price'].to_numpy(dtype=np.float64)[valid],
+                                                 df['availability_365'].to_numpy(dtype=np.float64)[valid])
+    counts = np.bincount(binned, minlength=len(hood.categories) * n_joint).reshape((-1,) + JOINT_SHAPE)
+    return {label: counts[code] for code, label in enumerate(hood.categories) if counts[code].any()}
+
+
+_memo = {}  # (builder, id(df)) -> aggregates, dropped again when the DataFrame is garbage collected
+
+
+def _memoized(builder, df):
+    key = (builder.__name__, id(df))
+    if key not in _memo:
+        _memo[key] = builder(df)
+        weakref.finalize(df, _memo.pop, key, None)
+    return _memo[key]
+
+
+# Cube of df, built on first request and reused by every plot of the same report
+def cube_for(df):
+    return _memoized(build_cube, df)
+
+
+# Dense (day x neighbourhood_group) matrices of the summed number_of_reviews and of the listing
+# count per last_review day. Built once from the parsed datetime64 column; every rolling window
+# and date cutoff is computed from these matrices and memoized, without re-grouping the rows.
+class DailyReviews:
+    def __init__(self, first_day, groups, sums, counts):
+        self.first_day = np.datetime64(first_day, 'D')
+        self.groups = list(groups)
+        self.sums = sums      # (D, G) float64
+        self.counts = counts  # (D, G) int64, 0 on days a group has no listing
+        self._rolled = {}
+
+    @property
+    def dates(self):
+        return pd.DatetimeIndex(self.first_day + np.arange(len(self.sums)), name='last_review')
+
+    def matrix(self):
+        return pd.DataFrame(self.sums, index=self.dates, columns=pd.Index(self.groups, name='neighbourhood_group'))
+
+    def _reindex(self, first_day, n_days, groups):
+        sums = np.zeros((n_days, len(groups)))
+        counts = np.zeros((n_days, len(groups)), dtype=np.int64)
+        offset = int((self.first_day - first_day).astype(np.int64))
+        columns = [groups.index(g) for g in self.groups]
+        sums[offset:offset + len(self.sums), columns] = self.sums
+        counts[offset:offset + len(self.counts), columns] = self.counts
+        return sums, counts
+
+    # Combine the daily sums of two disjoint sets of listings
+    def merge(self, other):
+        if not len(other.sums):
+            return self
+        if not len(self.sums):
+            return other
+        first_day = min(self.first_day, other.first_day)
+        last_day = max(self.first_day + len(self.sums), other.first_day + len(other.sums))
+        n_days = int((last_day - first_day).astype(np.int64))
+        groups = self.groups + [g for g in other.groups if g not in self.groups]
+        a_sums, a_counts = self._reindex(first_day, n_days, groups)
+        b_sums, b_counts = other._reindex(first_day, n_days, groups)
+        return DailyReviews(first_day, groups, a_sums + b_sums, a_counts + b_counts)
+
+    # Remove the daily sums of a subset of the listings; days left without any listing at
+    # either end are trimmed, so the range is the one build_daily_reviews would give
+    def subtract(self, other):
+        if not len(other.sums):
+            return self
+        unknown = set(other.groups) - set(self.groups)
+        last_day = self.first_day + len(self.sums)
+        if unknown or other.first_day < self.first_day or other.first_day + len(other.sums) > last_day:
+            raise ValueError('Cannot subtract reviews outside of the daily matrices')
+        b_sums, b_counts = other._reindex(self.first_day, len(self.sums), self.groups)
+        sums, counts = self.sums - b_sums, self.counts - b_counts
+        present = np.flatnonzero(counts.any(axis=1))
+        if not len(present):
+            return DailyReviews('1970-01-01', self.groups, sums[:0], counts[:0])
+        first, last = present[0], present[-1] + 1
+        return DailyReviews(self.first_day + first, self.groups, sums[first:last], counts[first:last])
+
+    # The matrices with exactly these group columns (groups missing here get zero columns)
+    def with_groups(self, groups):
+        groups = list(groups)
+        sums = np.zeros((len(self.sums), len(groups)))
+        counts = np.zeros((len(self.counts), len(groups)), dtype=np.int64)
+        for g, group in enumerate(groups):
+            if group in self.groups:
+                sums[:, g] = self.sums[:, self.groups.index(group)]
+                counts[:, g] = self.counts[:, self.groups.index(group)]
+        return DailyReviews(self.first_day, groups, sums, counts)
+
+    # Rolling mean of the daily sums from `start` on. An integer window rolls over each group's
+    # own review dates (days without listings are skipped and stay NaN, as the original
+    # groupby().rolling() did); an offset such as '7D' rolls over calendar days.
+    def rolling(self, window=2, start=None):
+        key = (window, start)
+        if key not in self._rolled:
+            first = 0
+            if start is not None:
+                first = max(0, int((np.datetime64(start, 'D') - self.first_day).astype(np.int64)))
+            matrix = self.matrix().iloc[first:]
+            if isinstance(window, int):
+                present = self.counts[first:] > 0
+                rolled = pd.DataFrame({group: matrix[group][present[:, g]].rolling(window, min_periods=1).mean()
+                                       for g, group in enumerate(self.groups)}, index=matrix.index)
+            else:
+                rolled = matrix.rolling(window, min_periods=1).mean()
+            self._rolled[key] = rolled
+        return self._rolled[key]
+
+
+# Build the daily matrices with one np.bincount over (day, neighbourhood_group) codes
+@traced('transform')
+def build_daily_reviews(df):
+    g_codes, groups = _codes_and_labels(df['neighbourhood_group'])
+    days = as_datetime(df['last_review']).to_numpy().astype('datetime64[D]')
+
+    valid = ~np.isnat(days) & (g_codes >= 0)
+    if not valid.any():
+        empty = np.zeros((0, len(groups)))
+        return DailyReviews('1970-01-01', groups, empty, empty.astype(np.int64))
+
+    first_day = days[valid].min()
+    day_index = (days[valid] - first_day).astype(np.int64)
+    n_days = int(day_index.max()) + 1
+    flat = day_index * len(groups) + g_codes[valid]
+    size = n_days * len(groups)
+
+    reviews = df['number_of_reviews'].to_numpy(dtype=np.float64)[valid]
+    sums = np.bincount(flat, weights=reviews, minlength=size).reshape(n_days, len(groups))
+    counts = np.bincount(flat, minlength=size).reshape(n_days, len(groups))
+    return DailyReviews(first_day, groups, sums, counts)
+
+
+# Neighbourhood histograms of df, built on first request and reused by every page and plot
+def neighbourhood_price_availability_for(df):
+    return _memoized(build_neighbourhood_price_availability, df)
+
+
+# Daily review matrices of df, built on first request and reused by every trend plot
+def daily_reviews_for(df):
+    return _memoized(build_daily_reviews, df)
+
+
+# Grid index of the listing coordinates with price and availability_365 sums per cell and
+# the neighbourhood / neighbourhood_group orderings for per-area queries (see spatial_index)
+@traced('transform')
+def build_listing_grid(df):
+    values = {measure: df[measure] for measure in ('price', 'availability_365') if measure in df.columns}
+    groups = {name: df[name] for name in ('neighbourhood', 'neighbourhood_group') if name in df.columns}
+    return GridIndex(df['longitude'], df['latitude'], values=values, groups=groups)
+
+
+# Grid index of df, built on first request and reused by every map of the same report
+def listing_grid_for(df):
+    return _memoized(build_listing_grid, df)
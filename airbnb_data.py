@@ -0,0 +1,233 @@
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from data_schema import SCHEMA_VERSION, encode_frame
+from instrumentation import span
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+source_path = script_dir + '/AirBnB_NY/'
+listings_file = source_path + 'AB_NYC_2019.csv'
+basemap_file = source_path + 'New_York_City_.png'  # map image of spatial_index.NYC_EXTENT
+
+# Columnar cache lives next to the source data, one directory per source file (keyed by its
+# absolute path, so inputs that share a file name, like every listings.csv, do not collide)
+cache_path = source_path + '.cache/'
+
+# Version of the cache layout; caches written by an older layout are rebuilt
+CACHE_FORMAT = 2
+
+
+# Explicit dtypes of every column the plots use. Free-text columns (name, host_name)
+# are never plotted, so they are not parsed at all.
+LISTING_DTYPES = {
+    'id': 'int64',
+    'host_id': 'int64',
+    'neighbourhood_group': 'category',
+    'neighbourhood': 'category',
+    'latitude': 'float32',
+    'longitude': 'float32',
+    'room_type': 'category',
+    'price': 'int32',
+    'minimum_nights': 'int32',
+    'number_of_reviews': 'int32',
+    'reviews_per_month': 'float32',
+    'calculated_host_listings_count': 'int32',
+    'availability_365': 'int32',
+}
+DATE_COLUMNS = ['last_review']
+LISTING_COLUMNS = list(LISTING_DTYPES) + DATE_COLUMNS
+
+
+# Columns each plot function of matplotlib_practical_task.py actually reads
+PLOT_COLUMNS = {
+    'plot_listing_across_neighbourhood_groups': ['neighbourhood_group'],
+    'plot_price_distrubution_by_neighbourhood_group': ['neighbourhood_group', 'price'],
+    'plot_average_availability_by_room_type_across_neighbourhoods': ['neighbourhood_group', 'room_type', 'availability_365'],
+    'plot_price_vs_Number_of_reviews_room_type': ['room_type', 'price', 'number_of_reviews'],
+    'plot_trend_number_of_reviews_over_last_review_foreach_neighbourhood': ['neighbourhood_group', 'last_review', 'number_of_reviews'],
+    'plot_relationship_between_price_availability_365_across_neighborhoods': ['neighbourhood_group', 'price', 'availability_365'],
+    'plot_reviews_by_room_type': ['neighbourhood_group', 'room_type', 'number_of_reviews'],
+    'plot_listing_density_map': ['longitude', 'latitude'],
+}
+
+# Files other than the listings a plot function reads; their digest is part of its data digest
+PLOT_INPUT_FILES = {
+    'plot_listing_density_map': [basemap_file],
+}
+
+# Files each plot function writes into plots_dest_path
+PLOT_FILES = {
+    'plot_listing_across_neighbourhood_groups': ['listing_across_neighbourhood_groups.png'],
+    'plot_price_distrubution_by_neighbourhood_group': ['price_distrubution_by_neighbourhood_group.png'],
+    'plot_average_availability_by_room_type_across_neighbourhoods': ['average_availability_by_room_type_across_neighbourhoods.png'],
+    'plot_price_vs_Number_of_reviews_room_type': ['price_vs_number_of_reviews_by_room_type.png'],
+    'plot_trend_number_of_reviews_over_last_review_foreach_neighbourhood': ['trend_of_number_of_reviews_over_time_by_neighbourhood_group.png'],
+    'plot_relationship_between_price_availability_365_across_neighborhoods': ['heatmap_of_price_vs_availability_across_neighbourhoods.png'],
+    'plot_reviews_by_room_type': ['number_of_reviews_by_room_type_across_neighbourhoods.png'],
+    'plot_listing_density_map': ['listing_density_map.png'],
+}
+
+
+_frames = {}  # in-process memo: (source sha256, columns) -> DataFrame
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _cache_dir_for(csv_path):
+    path_hash = hashlib.sha256(os.path.abspath(csv_path).encode()).hexdigest()[:16]
+    return cache_path + os.path.splitext(os.path.basename(csv_path))[0] + '-' + path_hash + '/'
+
+
+# Write an array to a temporary file and rename it over `path`: a frame still memory-mapping
+# the old file keeps its inode (truncating it in place would end in SIGBUS on the next read)
+def _save_column(path, values):
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        np.save(f, values)
+    os.replace(tmp, path)
+
+
+def _read_manifest(cache_dir):
+    try:
+        with open(cache_dir + 'manifest.json') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_manifest(cache_dir, manifest):
+    tmp = cache_dir + 'manifest.json.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp, cache_dir + 'manifest.json')  # readers never see a half-written manifest
+
+
+# Parse the CSV once and store every column as its own .npy file. Categorical columns
+# are stored as integer codes (in the data_schema order) with the labels kept in the manifest,
+# together with a content digest of every column (used as render cache key, see render_cache).
+def _build_cache(csv_path, cache_dir, stat, sha256):
+    os.makedirs(cache_dir, exist_ok=True)
+    if os.path.exists(cache_dir + 'manifest.json'):
+        os.remove(cache_dir + 'manifest.json')  # invalidate before touching the column files
+
+    with span('read_csv', 'load') as info:
+        df = encode_frame(pd.read_csv(csv_path, usecols=LISTING_COLUMNS, dtype=LISTING_DTYPES, parse_dates=DATE_COLUMNS))
+        info['rows'] = len(df)
+
+    columns = {}
+    for col in LISTING_COLUMNS:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            _save_column(cache_dir + col + '.npy', df[col].cat.codes.to_numpy())
+            columns[col] = {'kind': 'codes', 'categories': df[col].cat.categories.tolist()}
+        else:
+            _save_column(cache_dir + col + '.npy', df[col].to_numpy())
+            columns[col] = {'kind': 'values'}
+        columns[col]['sha256'] = file_sha256(cache_dir + col + '.npy')
+
+    manifest = {
+        'source': os.path.basename(csv_path),
+        'mtime_ns': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'sha256': sha256,
+        'format': CACHE_FORMAT,
+        'schema': SCHEMA_VERSION,
+        'rows': len(df),
+        'columns': columns,
+    }
+    _write_manifest(cache_dir, manifest)
+    return manifest
+
+
+# Return a valid manifest for csv_path, rebuilding the cache only when the content changed.
+# A matching mtime and size is trusted as-is; otherwise the file is hashed, which is still
+# far cheaper than parsing it, and a touched-but-identical file keeps its cache.
+def ensure_cache(csv_path=None):
+    csv_path = csv_path or listings_file
+    cache_dir = _cache_dir_for(csv_path)
+    stat = os.stat(csv_path)
+
+    manifest = _read_manifest(cache_dir)
+    if (manifest and manifest.get('format') == CACHE_FORMAT and manifest.get('schema') == SCHEMA_VERSION
+            and manifest.get('columns', {}).keys() >= set(LISTING_COLUMNS)):
+        if manifest['mtime_ns'] == stat.st_mtime_ns and manifest['size'] == stat.st_size:
+            return manifest
+        sha256 = file_sha256(csv_path)
+        if manifest['sha256'] == sha256:
+            manifest['mtime_ns'] = stat.st_mtime_ns
+            _write_manifest(cache_dir, manifest)
+            return manifest
+    else:
+        sha256 = file_sha256(csv_path)
+
+    return _build_cache(csv_path, cache_dir, stat, sha256)
+
+
+# Load the AirBnB listings on first use. Only the requested columns are read from the
+# columnar cache; mmap=True maps them read-only so several processes share the same pages.
+def load_listings(columns=None, csv_path=None, mmap=False):
+    csv_path = csv_path or listings_file
+    columns = tuple(columns or LISTING_COLUMNS)
+    unknown = set(columns) - set(LISTING_COLUMNS)
+    if unknown:
+        raise KeyError('Unknown listing columns: ' + ', '.join(sorted(unknown)))
+
+    manifest = ensure_cache(csv_path)
+    key = (manifest['sha256'], columns, mmap)
+    if key in _frames:
+        return _frames[key]
+
+    cache_dir = _cache_dir_for(csv_path)
+    data = {}
+    with span('load_listings', 'load', rows=manifest['rows'], columns=len(columns), mmap=mmap):
+        for col in columns:
+            values = np.load(cache_dir + col + '.npy', mmap_mode='r' if mmap else None)
+            info = manifest['columns'][col]
+            if info['kind'] == 'codes':
+                data[col] = pd.Categorical.from_codes(values, categories=info['categories'])
+            else:
+                data[col] = values
+
+        df = pd.DataFrame(data, copy=False)
+    _frames[key] = df
+    return df
+
+
+# Forget the in-process frames (the next load_listings maps the cache files again)
+def forget_frames():
+    _frames.clear()
+
+
+# Remove the columnar cache of csv_path, e.g. of a temporary benchmark file
+def drop_cache(csv_path):
+    forget_frames()
+    shutil.rmtree(_cache_dir_for(csv_path), ignore_errors=True)
+
+
+# Columns needed by one plot function or by several (their union), e.g.
+# load_plot_data('plot_reviews_by_room_type') or load_plot_data(['plot_listing_density_map', ...])
+def load_plot_data(plot_names, csv_path=None, mmap=False):
+    plot_names = [plot_names] if isinstance(plot_names, str) else plot_names
+    needed = {col for plot_name in plot_names for col in PLOT_COLUMNS[plot_name]}
+    return load_listings([col for col in LISTING_COLUMNS if col in needed], csv_path=csv_path, mmap=mmap)
+
+
+# Digest of the data slice a plot function reads, straight from the cache manifest
+# (no column is loaded), plus the digest of its other input files (PLOT_INPUT_FILES);
+# identical columns of a changed CSV keep their digest.
+def plot_data_digest(plot_name, csv_path=None):
+    manifest = ensure_cache(csv_path or listings_file)
+    data = {col: manifest['columns'][col]['sha256'] for col in PLOT_COLUMNS[plot_name]}
+    for path in PLOT_INPUT_FILES.get(plot_name, []):
+        data[os.path.basename(path)] = file_sha256(path)
+    return data
@@ -0,0 +1,269 @@
+# Incremental refresh of the AirBnB reports from daily listing snapshots.
+#
+#   python airbnb_incremental.py AirBnB_NY/AB_NYC_2019.csv              # first run: full build
+#   python airbnb_incremental.py snapshots/2019-07-09.csv -o plots/     # every following day
+#   python airbnb_incremental.py snapshots/2019-07-10.csv --verify      # also compare to a full build
+#
+# The aggregates behind the reports (AggregateCube and DailyReviews, see airbnb_aggregates)
+# are persisted together with a compact copy of the last snapshot: listing id, a hash of all
+# report columns and the columns the aggregates read, sorted by id. A new snapshot is diffed
+# against it by id into added, removed and changed listings; the old versions of removed and
+# changed rows are subtracted from the aggregates and the new versions of added and changed
+# rows are merged in. Reading and diffing the snapshot is a vectorized pass over it, the
+# aggregation work depends on the churn only. Minimum and maximum cannot be subtracted, so
+# the cells where a leaving row held one are recomputed from the rows of those cells.
+# Only plots whose aggregate changed are drawn again (see render_cache). The price vs.
+# reviews scatter needs every row and stays with matplotlib_practical_task.py.
+
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from airbnb_aggregates import CUBE_MEASURES, AggregateCube, DailyReviews, build_cube, build_daily_reviews
+from airbnb_data import DATE_COLUMNS, LISTING_COLUMNS, LISTING_DTYPES, cache_path
+from airbnb_stream import AGGREGATE_PLOTS, STREAM_COLUMNS, render_aggregate_reports
+from data_schema import SCHEMA_VERSION, code_of, codes, encode_frame
+from instrumentation import span, traced
+from render_cache import RenderCache, array_digest, digest
+
+# Aggregates and last snapshot live in the (git-ignored) columnar cache directory
+state_path = cache_path + 'incremental/'
+
+# Version of the state layout; a state written by an older layout means a full build
+STATE_FORMAT = 2
+
+SNAPSHOT_COLUMNS = ['id'] + STREAM_COLUMNS + ['row_hash']
+CUBE_ARRAYS = ['count', 'sums', 'sumsq', 'mins', 'maxs', 'sketch', 'sum_xy', 'joint']
+
+
+# Read a snapshot CSV into the compact, id-sorted form that is diffed and persisted
+def read_snapshot(csv_path):
+    with span('read_csv', 'load') as info:
+        df = encode_frame(pd.read_csv(csv_path, usecols=LISTING_COLUMNS, dtype=LISTING_DTYPES, parse_dates=DATE_COLUMNS))
+        info['rows'] = len(df)
+
+    # Any edit of a report column marks the listing as changed, even if no aggregate reads it
+    df['row_hash'] = pd.util.hash_pandas_object(df[LISTING_COLUMNS], index=False).to_numpy()
+    snapshot = df[SNAPSHOT_COLUMNS].sort_values('id', kind='stable').reset_index(drop=True)
+    ids = snapshot['id'].to_numpy()
+    if (ids[1:] == ids[:-1]).any():
+        raise ValueError(f'{csv_path}: duplicate listing ids')
+    return snapshot
+
+
+# Row positions of the churn between two id-sorted snapshots: removed and changed rows in old,
+# added and changed rows in new (changed_old[i] and changed_new[i] are the same listing)
+@traced('transform')
+def diff_snapshots(old, new):
+    _, old_pos, new_pos = np.intersect1d(old['id'].to_numpy(), new['id'].to_numpy(),
+                                         assume_unique=True, return_indices=True)
+    changed = old['row_hash'].to_numpy()[old_pos] != new['row_hash'].to_numpy()[new_pos]
+    kept_old = np.zeros(len(old), dtype=bool)
+    kept_old[old_pos] = True
+    kept_new = np.zeros(len(new), dtype=bool)
+    kept_new[new_pos] = True
+    return {
+        'removed': np.flatnonzero(~kept_old),
+        'added': np.flatnonzero(~kept_new),
+        'changed_old': old_pos[changed],
+        'changed_new': new_pos[changed],
+    }
+
+
+# Min/max of the stale cells, recomputed from the snapshot rows of just those cells
+def _recompute_extrema(cube, stale, snapshot):
+    group, room = snapshot['neighbourhood_group'], snapshot['room_type']
+    g_codes, r_codes = codes(group), codes(room)
+    cell = np.full(len(snapshot), -1, dtype=np.intp)
+    for g, r in zip(*np.nonzero(stale)):
+        in_cell = (g_codes == code_of(group, cube.groups[g])) & (r_codes == code_of(room, cube.room_types[r]))
+        cell[in_cell] = g * len(cube.room_types) + r
+    rows = np.flatnonzero(cell >= 0)
+
+    flat = stale.reshape(-1)
+    for m, measure in enumerate(CUBE_MEASURES):
+        values = snapshot[measure].to_numpy(dtype=np.float64)[rows]
+        mins, maxs = cube.mins[m].reshape(-1), cube.maxs[m].reshape(-1)
+        mins[flat], maxs[flat] = np.inf, -np.inf
+        np.minimum.at(mins, cell[rows], values)
+        np.maximum.at(maxs, cell[rows], values)
+    return cube
+
+
+# Aggregates of new, derived from the aggregates of old and the churn between the two
+@traced('transform')
+def apply_delta(cube, daily, old, new, delta):
+    rows_out = old.iloc[np.concatenate([delta['removed'], delta['changed_old']])]
+    rows_in = new.iloc[np.concatenate([delta['added'], delta['changed_new']])]
+    if len(rows_out):
+        cube, stale = cube.subtract(build_cube(rows_out))
+        daily = daily.subtract(build_daily_reviews(rows_out))
+        if stale.any():
+            cube = _recompute_extrema(cube, stale, new)
+    if len(rows_in):
+        cube = cube.merge(build_cube(rows_in))
+        daily = daily.merge(build_daily_reviews(rows_in))
+    cube = cube.compact()
+    return cube, daily.with_groups(cube.groups)
+
+
+def _write_manifest(state_dir, manifest):
+    tmp = state_dir + 'manifest.json.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp, state_dir + 'manifest.json')
+
+
+# Persist snapshot and aggregates. The manifest is removed first and written last, so an
+# interrupted save leaves no state and the next run does a full build.
+def save_state(snapshot, cube, daily, source, state_dir=state_path):
+    os.makedirs(state_dir, exist_ok=True)
+    if os.path.exists(state_dir + 'manifest.json'):
+        os.remove(state_dir + 'manifest.json')
+
+    arrays, columns = {}, {}
+    for col in SNAPSHOT_COLUMNS:
+        if isinstance(snapshot[col].dtype, pd.CategoricalDtype):
+            arrays['snapshot.' + col] = codes(snapshot[col])
+            columns[col] = {'kind': 'codes', 'categories': snapshot[col].cat.categories.tolist()}
+        else:
+            arrays['snapshot.' + col] = snapshot[col].to_numpy()
+            columns[col] = {'kind': 'values'}
+    for name in CUBE_ARRAYS:
+        arrays['cube.' + name] = getattr(cube, name)
+    arrays['daily.sums'], arrays['daily.counts'] = daily.sums, daily.counts
+
+    with open(state_dir + 'state.npz.tmp', 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(state_dir + 'state.npz.tmp', state_dir + 'state.npz')
+    _write_manifest(state_dir, {
+        'format': STATE_FORMAT,
+        'schema': SCHEMA_VERSION,
+        'source': os.path.basename(source),
+        'rows': len(snapshot),
+        'columns': columns,
+        'cube': {'groups': cube.groups, 'room_types': cube.room_types},
+        'daily': {'first_day': str(daily.first_day), 'groups': daily.groups},
+    })
+
+
+# (snapshot, cube, daily) of the last run, None if there is no usable state
+def load_state(state_dir=state_path):
+    try:
+        with open(state_dir + 'manifest.json') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('format') != STATE_FORMAT or manifest.get('schema') != SCHEMA_VERSION:
+        return None
+
+    with span('load_state', 'load', rows=manifest['rows']), np.load(state_dir + 'state.npz') as arrays:
+        data = {}
+        for col, info in manifest['columns'].items():
+            values = arrays['snapshot.' + col]
+            data[col] = pd.Categorical.from_codes(values, categories=info['categories']) if info['kind'] == 'codes' else values
+        snapshot = pd.DataFrame(data, columns=SNAPSHOT_COLUMNS)
+        cube = AggregateCube(manifest['cube']['groups'], manifest['cube']['room_types'],
+                             **{name: arrays['cube.' + name] for name in CUBE_ARRAYS})
+        daily = DailyReviews(manifest['daily']['first_day'], manifest['daily']['groups'],
+                             arrays['daily.sums'], arrays['daily.counts'])
+    return snapshot, cube, daily
+
+
+# Bring the persisted aggregates to the state of csv_path; returns (cube, daily, snapshot, churn)
+# where churn is None after a full build
+def refresh(csv_path, state_dir=state_path, rebuild=False):
+    new = read_snapshot(csv_path)
+    state = None if rebuild else load_state(state_dir)
+    if state is None:
+        cube, daily, delta = build_cube(new), build_daily_reviews(new), None
+    else:
+        old, cube, daily = state
+        delta = diff_snapshots(old, new)
+        cube, daily = apply_delta(cube, daily, old, new, delta)
+    save_state(new, cube, daily, csv_path, state_dir)
+    churn = None if delta is None else {
+        'added': len(delta['added']), 'removed': len(delta['removed']), 'changed': len(delta['changed_new'])}
+    return cube, daily, new, churn
+
+
+def _aggregate_digest(aggregate):
+    return digest({name: array_digest(value) if isinstance(value, np.ndarray) else value
+                   for name, value in vars(aggregate).items() if not name.startswith('_')})
+
+
+# Draw the plots whose aggregate differs from their last render; returns the drawn plot names
+def render_changed(cube, daily, plots_dest_path, force=False):
+    import matplotlib_practical_task as tasks
+
+    cache = RenderCache(plots_dest_path)
+    data = {'cube': _aggregate_digest(cube), 'daily': _aggregate_digest(daily)}
+    keys = {plot_name: cache.key(getattr(tasks, plot_name), data[aggregate])
+            for plot_name, aggregate in AGGREGATE_PLOTS.items()}
+    stale = [plot_name for plot_name, key in keys.items() if force or not cache.fresh(plot_name, key)]
+    if stale:
+        render_aggregate_reports(cube, daily, plots_dest_path, plot_names=stale)
+    for plot_name in stale:
+        cache.record(plot_name, keys[plot_name], tasks.PLOT_FILES[plot_name])
+    return stale
+
+
+# Names of the aggregates that differ from a full build over snapshot (empty if none)
+def verify(cube, daily, snapshot):
+    full_cube, full_daily = build_cube(snapshot), build_daily_reviews(snapshot)
+    problems = []
+    if (cube.groups, cube.room_types) != (full_cube.groups, full_cube.room_types):
+        problems.append('cube labels')
+    else:
+        problems += ['cube.' + name for name in CUBE_ARRAYS
+                     if not np.array_equal(getattr(cube, name), getattr(full_cube, name))]
+    if (daily.first_day, daily.groups) != (full_daily.first_day, full_daily.groups):
+        problems.append('daily range')
+    else:
+        problems += ['daily.' + name for name in ('sums', 'counts')
+                     if not np.array_equal(getattr(daily, name), getattr(full_daily, name))]
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Refresh the AirBnB reports from a new listings snapshot.')
+    parser.add_argument('csv_path', help='snapshot CSV in the AB_NYC_2019.csv format')
+    parser.add_argument('-o', '--dest', default=None, help='output directory (default: plots/)')
+    parser.add_argument('--state', default=state_path, help='directory of the persisted aggregates')
+    parser.add_argument('--rebuild', action='store_true', help='ignore the persisted state, build from scratch')
+    parser.add_argument('--force', action='store_true', help='draw every plot, changed or not')
+    parser.add_argument('--no-render', action='store_true', help='only update the aggregates')
+    parser.add_argument('--verify', action='store_true', help='compare the result with a full build')
+    args = parser.parse_args(argv)
+
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib_practical_task as tasks
+
+    cube, daily, snapshot, churn = refresh(args.csv_path, os.path.join(args.state, ''), rebuild=args.rebuild)
+    if churn is None:
+        print(f'{args.csv_path}: {len(snapshot)} listings, full build')
+    else:
+        print(f"{args.csv_path}: {len(snapshot)} listings, {churn['added']} added, "
+              f"{churn['removed']} removed, {churn['changed']} changed")
+
+    if args.verify:
+        problems = verify(cube, daily, snapshot)
+        print('verify: ' + (', '.join(problems) + ' differ from a full build' if problems else 'identical to a full build'))
+        if problems:
+            return 1
+
+    if not args.no_render:
+        dest = os.path.join(args.dest, '') if args.dest else tasks.plots_dest_path
+        os.makedirs(dest, exist_ok=True)
+        drawn = render_changed(cube, daily, dest, force=args.force)
+        print(f'{len(drawn)} plot(s) drawn into {dest}' + (': ' + ', '.join(drawn) if drawn else ''))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,145 @@
+# Out-of-core report pipeline for many Inside Airbnb city dumps at once.
+#
+#   python airbnb_stream.py data/*/listings.csv.gz -o plots/ --chunksize 200000 -j 4
+#
+# Both Inside Airbnb formats are read: the summary listings.csv (the AB_NYC_2019.csv
+# columns) and the detailed listings.csv.gz, whose borough column is
+# neighbourhood_group_cleansed and whose prices are strings like "$1,150.00".
+# Each file is read with pd.read_csv(chunksize=...) and folded into the same aggregates the
+# in-memory plots use (airbnb_aggregates.AggregateCube and DailyReviews). Aggregates
+# of chunks and of files are merged, so peak memory depends on the chunk size only.
+# The price vs. reviews scatter needs row-level data and is therefore not part of this mode.
+
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import reduce
+
+import pandas as pd
+
+from airbnb_aggregates import CUBE_MEASURES, build_cube, build_daily_reviews
+
+
+DEFAULT_CHUNKSIZE = 200_000
+
+STREAM_COLUMNS = ['neighbourhood_group', 'room_type', 'last_review'] + CUBE_MEASURES
+STREAM_DTYPES = {
+    'neighbourhood_group': 'category',
+    'room_type': 'category',
+    'price': 'float64',  # city dumps have missing prices, so no integer dtype here
+    'availability_365': 'float64',
+    'number_of_reviews': 'float64',
+}
+
+# Columns of the detailed dumps that hold a STREAM_COLUMNS column under another name
+DETAILED_COLUMNS = {'neighbourhood_group_cleansed': 'neighbourhood_group'}
+
+
+# Every plot that can be drawn from the aggregates alone, with the aggregate it reads
+AGGREGATE_PLOTS = {
+    'plot_listing_across_neighbourhood_groups': 'cube',
+    'plot_price_distrubution_by_neighbourhood_group': 'cube',
+    'plot_average_availability_by_room_type_across_neighbourhoods': 'cube',
+    'plot_trend_number_of_reviews_over_last_review_foreach_neighbourhood': 'daily',
+    'plot_relationship_between_price_availability_365_across_neighborhoods': 'cube',
+    'plot_reviews_by_room_type': 'cube',
+}
+
+
+# Source column of every STREAM_COLUMNS column in the file, and whether it is a detailed dump
+def _source_columns(path):
+    header = set(pd.read_csv(path, nrows=0).columns)
+    columns = {column: column for column in STREAM_COLUMNS if column in header}
+    for source, column in DETAILED_COLUMNS.items():
+        if column not in header and source in header:
+            columns[source] = column
+    missing = set(STREAM_COLUMNS) - set(columns.values())
+    if missing:
+        raise ValueError(f"{path}: no column {', '.join(sorted(missing))}")
+    return columns, any(source in columns for source in DETAILED_COLUMNS)
+
+
+def iter_chunks(path, chunksize=DEFAULT_CHUNKSIZE):
+    columns, detailed = _source_columns(path)
+    dtypes = {source: STREAM_DTYPES[column] for source, column in columns.items() if column in STREAM_DTYPES}
+    if detailed:
+        dtypes['price'] = 'str'  # "$1,150.00", converted per chunk
+    reader = pd.read_csv(path, usecols=list(columns), dtype=dtypes, parse_dates=['last_review'], chunksize=chunksize)
+    with reader:
+        for chunk in reader:
+            chunk = chunk.rename(columns=columns)
+            if detailed:
+                chunk['price'] = pd.to_numeric(chunk['price'].str.replace(r'[$,]', '', regex=True), errors='coerce')
+            yield chunk.dropna(subset=CUBE_MEASURES)
+
+
+# (cube, daily review sums, row count) of one file, folded chunk by chunk
+def aggregate_file(path, chunksize=DEFAULT_CHUNKSIZE):
+    cube, daily, rows = None, None, 0
+    for chunk in iter_chunks(path, chunksize):
+        chunk_cube, chunk_daily = build_cube(chunk), build_daily_reviews(chunk)
+        cube = chunk_cube if cube is None else cube.merge(chunk_cube)
+        daily = chunk_daily if daily is None else daily.merge(chunk_daily)
+        rows += len(chunk)
+    return cube, daily, rows
+
+
+def _merge_results(a, b):
+    if a[0] is None:
+        return b
+    if b[0] is None:
+        return a
+    return a[0].merge(b[0]), a[1].merge(b[1]), a[2] + b[2]
+
+
+# Aggregate all files; with jobs > 1 files are aggregated in parallel and merged afterwards
+def aggregate_files(paths, chunksize=DEFAULT_CHUNKSIZE, jobs=1):
+    if jobs > 1 and len(paths) > 1:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(paths))) as pool:
+            results = list(pool.map(aggregate_file, paths, [chunksize] * len(paths)))
+    else:
+        results = [aggregate_file(path, chunksize) for path in paths]
+    return reduce(_merge_results, results, (None, None, 0))
+
+
+# Render every cube-backed plot (and the review trend) from the streamed aggregates
+def render_streamed_reports(paths, plots_dest_path, chunksize=DEFAULT_CHUNKSIZE, jobs=1, show=False):
+    cube, daily, rows = aggregate_files(paths, chunksize=chunksize, jobs=jobs)
+    if cube is None:
+        raise ValueError('No listings found in ' + ', '.join(paths))
+    render_aggregate_reports(cube, daily, plots_dest_path, show=show)
+    return rows
+
+
+# Render the plots of AGGREGATE_PLOTS (or only plot_names) from a cube and daily review matrices
+def render_aggregate_reports(cube, daily, plots_dest_path, show=False, plot_names=None):
+    import matplotlib_practical_task as tasks
+
+    aggregates = {'cube': cube, 'daily': daily}
+    for plot_name in plot_names or AGGREGATE_PLOTS:
+        aggregate = AGGREGATE_PLOTS[plot_name]
+        getattr(tasks, plot_name)(None, plots_dest_path, show=show, **{aggregate: aggregates[aggregate]})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render the AirBnB reports over many listing dumps in chunks.')
+    parser.add_argument('paths', nargs='+', help='listings CSV files (.csv or .csv.gz)')
+    parser.add_argument('-o', '--dest', default=None, help='output directory (default: plots/)')
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE, help='rows per chunk')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='files aggregated in parallel')
+    args = parser.parse_args(argv)
+
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib_practical_task as tasks
+
+    dest = os.path.join(args.dest, '') if args.dest else tasks.plots_dest_path
+    os.makedirs(dest, exist_ok=True)
+    rows = render_streamed_reports(args.paths, dest, chunksize=args.chunksize, jobs=args.jobs)
+    print(f'{rows} listings from {len(args.paths)} file(s) aggregated into {dest}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
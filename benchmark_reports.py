@@ -0,0 +1,246 @@
+# Benchmark harness for the report code.
+#
+#   python benchmark_reports.py                                # 10^3 .. 10^6 rows, both datasets
+#   python benchmark_reports.py --sizes 1e3 1e7 --datasets airbnb -o bench/after.json
+#   python benchmark_reports.py --compare bench/before.json bench/after.json
+#
+# For every size, synthetic AirBnB- and Titanic-schema data (see synthetic_data) is written
+# to a temporary CSV and each stage is timed on its own, with the peak of the memory
+# allocated during the stage (tracemalloc; --no-memory for undisturbed timings):
+#   prepare    CSV -> columnar cache -> frame (AirBnB), prepare_data_for_processing (Titanic)
+#   aggregate  cube / daily review matrices, survival cube / selection rows / scatter columns
+#   render     the matplotlib plot functions (Agg) and the three Bokeh builders
+#              (document built and serialized as for a bokeh serve session)
+#   update     the Python update() callbacks of the Bokeh charts (one Class and one Gender change)
+# Results are written as JSON together with the commit and library versions, so runs of
+# two commits can be compared with --compare.
+
+import argparse
+import inspect
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from importlib import metadata
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+import airbnb_data
+import synthetic_data
+import titanic_data
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_SIZES = [10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6]
+DATASETS = ['airbnb', 'titanic']
+LIBRARIES = ('numpy', 'pandas', 'matplotlib', 'bokeh')
+
+
+class Recorder:
+    def __init__(self, memory=True):
+        self.memory = memory
+        self.results = []
+
+    # Run func() as one measured stage and return its value
+    def measure(self, dataset, rows, stage, name, func):
+        if self.memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        value = func()
+        seconds = time.perf_counter() - start
+        peak = None
+        if self.memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        self.results.append({'dataset': dataset, 'rows': rows, 'stage': stage, 'name': name,
+                             'seconds': seconds, 'peak_bytes': peak})
+        print(f'{dataset:8} {rows:>10} {stage:10} {name:70} {seconds:9.4f} s'
+              + (f' {peak / 2 ** 20:10.1f} MiB' if peak is not None else ''))
+        return value
+
+
+def bench_airbnb(recorder, rows, work_dir, seed):
+    import matplotlib_practical_task as tasks
+    from airbnb_aggregates import build_cube, build_daily_reviews, build_listing_grid
+
+    csv_path = synthetic_data.write_csv(synthetic_data.synthetic_listings(rows, seed),
+                                        os.path.join(work_dir, f'bench_listings_{rows}.csv'))
+    try:
+        recorder.measure('airbnb', rows, 'prepare', 'csv_to_cache', lambda: airbnb_data.load_listings(csv_path=csv_path))
+        airbnb_data.forget_frames()
+        df = recorder.measure('airbnb', rows, 'prepare', 'load_cached', lambda: airbnb_data.load_listings(csv_path=csv_path))
+
+        cube = recorder.measure('airbnb', rows, 'aggregate', 'build_cube', lambda: build_cube(df))
+        daily = recorder.measure('airbnb', rows, 'aggregate', 'build_daily_reviews', lambda: build_daily_reviews(df))
+        grid = recorder.measure('airbnb', rows, 'aggregate', 'build_listing_grid', lambda: build_listing_grid(df))
+        aggregates = {'cube': cube, 'daily': daily, 'grid': grid}
+
+        plots_dir = os.path.join(work_dir, 'plots', '')
+        os.makedirs(plots_dir, exist_ok=True)
+        for plot_name in airbnb_data.PLOT_FILES:
+            plot = getattr(tasks, plot_name)
+            parameters = inspect.signature(plot).parameters
+            kwargs = {name: value for name, value in aggregates.items() if name in parameters}
+
+            def render():
+                plot(df, plots_dir, show=False, **kwargs)
+                plt.close('all')
+            recorder.measure('airbnb', rows, 'render', plot_name, render)
+    finally:
+        airbnb_data.drop_cache(csv_path)
+
+
+def _selects(layout):
+    return layout.children[0].children  # (class_select, gender_select) of every chart
+
+
+def bench_titanic(recorder, rows, work_dir, seed):
+    from bokeh.io import curdoc
+    import Bokeh_practical_tasks as charts
+    from fare_lod import FareLodIndex
+
+    csv_path = synthetic_data.write_csv(synthetic_data.synthetic_passengers(rows, seed),
+                                        os.path.join(work_dir, f'bench_titanic_{rows}.csv'))
+    df = recorder.measure('titanic', rows, 'prepare', 'prepare_data_for_processing',
+                          lambda: titanic_data.prepare_data_for_processing(csv_path))
+
+    cube = recorder.measure('titanic', rows, 'aggregate', 'build_survival_cube', lambda: titanic_data.build_survival_cube(df))
+    selection_rows = recorder.measure('titanic', rows, 'aggregate', 'build_selection_rows',
+                                      lambda: titanic_data.build_selection_rows(df))
+    columns = recorder.measure('titanic', rows, 'aggregate', 'build_scatter_columns',
+                               lambda: titanic_data.build_scatter_columns(df))
+    lod_index = recorder.measure('titanic', rows, 'aggregate', 'FareLodIndex',
+                                 lambda: FareLodIndex(columns, selection_rows))
+
+    builders = {
+        'age_group_survival': lambda: charts.age_group_survival(df, cube, serve=True),
+        'class_gender': lambda: charts.class_gender(df, cube, serve=True),
+        'fare_vs_survival': lambda: charts.fare_vs_survival(df, serve=True, columns=columns,
+                                                            selection_rows=selection_rows, lod_index=lod_index),
+    }
+    for name, build in builders.items():
+        doc = curdoc()
+        doc.clear()
+
+        def render():
+            layout = build()
+            doc.to_json()  # what a new bokeh serve session sends to the browser
+            return layout
+        layout = recorder.measure('titanic', rows, 'render', name, render)
+
+        class_select, gender_select = _selects(layout)
+
+        def update():
+            class_select.value = class_select.options[1]
+            gender_select.value = gender_select.options[1]
+        recorder.measure('titanic', rows, 'update', name, update)
+        doc.clear()
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=script_dir, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _versions():
+    versions = {}
+    for name in LIBRARIES:
+        try:
+            versions[name] = metadata.version(name)
+        except metadata.PackageNotFoundError:
+            versions[name] = None
+    return versions
+
+
+def run_benchmarks(sizes=None, datasets=None, memory=True, seed=0, work_dir=None):
+    sizes = sizes or DEFAULT_SIZES
+    datasets = datasets or DATASETS
+    recorder = Recorder(memory=memory)
+    own_dir = work_dir is None
+    work_dir = work_dir or tempfile.mkdtemp(prefix='bench_reports_')
+    try:
+        for rows in sizes:
+            if 'airbnb' in datasets:
+                bench_airbnb(recorder, rows, work_dir, seed)
+            if 'titanic' in datasets:
+                bench_titanic(recorder, rows, work_dir, seed)
+    finally:
+        if own_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        'meta': {
+            'commit': _git_commit(),
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'libraries': _versions(),
+            'sizes': sizes,
+            'memory_tracked': memory,
+            'seed': seed,
+        },
+        'results': recorder.results,
+    }
+
+
+# Print new/old time ratios per stage; return the number of stages slower than threshold
+def compare(baseline, current, threshold=1.2):
+    def by_key(run):
+        return {(r['dataset'], r['rows'], r['stage'], r['name']): r for r in run['results']}
+    old, new = by_key(baseline), by_key(current)
+    print(f"baseline {baseline['meta'].get('commit')}  current {current['meta'].get('commit')}")
+    regressions = 0
+    for key in sorted(old.keys() & new.keys()):
+        ratio = new[key]['seconds'] / old[key]['seconds'] if old[key]['seconds'] else float('inf')
+        flag = ''
+        if ratio > threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        dataset, rows, stage, name = key
+        print(f"{dataset:8} {rows:>10} {stage:10} {name:70} {old[key]['seconds']:9.4f} -> "
+              f"{new[key]['seconds']:9.4f} s  x{ratio:5.2f}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the report code on synthetic data.')
+    parser.add_argument('--sizes', nargs='+', type=lambda s: int(float(s)), default=None,
+                        help='row counts, e.g. 1e3 1e5 (default: 1e3 1e4 1e5 1e6)')
+    parser.add_argument('--datasets', nargs='+', choices=DATASETS, default=None, help='default: both')
+    parser.add_argument('--no-memory', action='store_true', help='do not trace peak memory (faster, exact timings)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', default='bench_results.json', help='JSON result file')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'),
+                        help='compare two result files instead of running')
+    parser.add_argument('--threshold', type=float, default=1.2, help='slowdown ratio reported as regression')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            baseline = json.load(f)
+        with open(args.compare[1]) as f:
+            current = json.load(f)
+        return 1 if compare(baseline, current, args.threshold) else 0
+
+    run = run_benchmarks(args.sizes, args.datasets, memory=not args.no_memory, seed=args.seed)
+    output_dir = os.path.dirname(os.path.abspath(args.output))
+    os.makedirs(output_dir, exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(run, f, indent=1)
+    print(f'{len(run["results"])} measurements written to {args.output}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
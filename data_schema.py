@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+
+# Fixed category orders of the label columns of both datasets. Every loader encodes these
+# columns as pd.Categorical in exactly this order, so filters and group-bys compare small
+# integer codes instead of Python strings, and code i means the same label in every frame,
+# chunk and file. Labels are only looked up again when a chart is drawn.
+#
+# The orders are the sorted labels, which the group-by based charts always showed. The one
+# exception is the price box plot, which listed the boroughs in CSV order; its boxes are now
+# sorted too (each keeps its colour, see plot_price_distrubution_by_neighbourhood_group).
+CATEGORIES = {
+    'neighbourhood_group': ['Bronx', 'Brooklyn', 'Manhattan', 'Queens', 'Staten Island'],
+    'room_type': ['Entire home/apt', 'Private room', 'Shared room'],
+    'Sex': ['female', 'male'],
+    'AgeGroup': ['Adult', 'Child', 'Senior', 'Young Adult'],
+    'Embarked': ['C', 'Q', 'S', 'N/A'],
+    'Pclass': [1, 2, 3],
+}
+
+# Bump when CATEGORIES changes, so caches holding codes of the old order are rebuilt
+SCHEMA_VERSION = 1
+
+
+# Categories of a column: the fixed order first, then labels the schema does not know yet
+# (e.g. the boroughs of another city's dump) in sorted order, so nothing is ever dropped.
+def categories_for(name, values=()):
+    fixed = CATEGORIES[name]
+    known = set(fixed)
+    extra = sorted({value for value in values if value not in known and not pd.isna(value)})
+    return fixed + extra
+
+
+# Encode a column with the schema order; values may be a Series, an array or a categorical
+def encode(name, values):
+    series = values if isinstance(values, pd.Series) else pd.Series(values)
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        categories = categories_for(name, series.cat.categories)
+        if list(series.cat.categories) != categories:
+            series = series.cat.set_categories(categories)
+        return series
+    return series.astype(pd.CategoricalDtype(categories_for(name, series.unique())))
+
+
+# Encode every schema column present in df, in place
+def encode_frame(df):
+    for name in CATEGORIES:
+        if name in df.columns:
+            df[name] = encode(name, df[name])
+    return df
+
+
+# Integer code of a label in an encoded column (-1 if the column has no such category)
+def code_of(series, label):
+    categories = series.cat.categories
+    return int(categories.get_loc(label)) if label in categories else -1
+
+
+# Codes of an encoded column as a numpy array (-1 marks missing values)
+def codes(series):
+    return np.asarray(series.cat.codes)
+
+
+# A date column as datetime64; a frame straight from pd.read_csv (no parse_dates) holds strings
+def as_datetime(series):
+    return series if pd.api.types.is_datetime64_any_dtype(series) else pd.to_datetime(series)
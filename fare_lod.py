@@ -0,0 +1,134 @@
+import numpy as np
+
+
+# A viewport showing at most this many passengers gets the raw rows; wider views get bins
+RAW_POINT_LIMIT = 5_000
+
+# Roughly how many Fare bins an aggregated viewport is split into
+TARGET_BINS = 400
+
+# Resolution levels of the index: level L splits the full Fare range into 2**L bins
+MIN_LEVEL, MAX_LEVEL = 3, 16
+
+
+# Multi-resolution index over the Fare vs. Survival rows of every Class/Gender selection.
+#
+# Per selection it keeps the row positions sorted by Fare for each Survived value, so the
+# number of passengers inside a viewport is two binary searches, and an aggregate pyramid:
+# the finest level is one np.bincount over (fare bin, Survived, Pclass) and every coarser
+# level is derived from the level below it, never from the rows. query() serves whichever
+# of the two the viewport needs, with the column layout of build_scatter_columns plus
+# 'size' and 'count'.
+class FareLodIndex:
+    def __init__(self, columns, selection_rows, raw_limit=RAW_POINT_LIMIT, target_bins=TARGET_BINS):
+        self.columns = columns
+        self.selection_rows = selection_rows
+        self.raw_limit = raw_limit
+        self.target_bins = target_bins
+
+        self.fare = np.asarray(columns['Fare'], dtype=np.float64)
+        self.survived = np.asarray(columns['Survived']).astype(np.intp)
+        self.classes, self.class_codes = np.unique(np.asarray(columns['Pclass']), return_inverse=True)
+        self.is_male = np.asarray(columns['Sex']) == 'male'
+        self.age = np.asarray(columns['Age'], dtype=np.float64)
+
+        self.fare_min = float(self.fare.min()) if len(self.fare) else 0.0
+        self.fare_max = float(self.fare.max()) if len(self.fare) else 1.0
+        self.fare_span = max(self.fare_max - self.fare_min, 1e-9)
+
+        self._sorted = {}   # selection -> {survived: (rows sorted by fare, their fares)}
+        self._levels = {}   # selection -> {level: aggregate dict}
+
+    def _bins(self, fare, level):
+        return np.clip(((fare - self.fare_min) / self.fare_span * (1 << level)).astype(np.intp), 0, (1 << level) - 1)
+
+    def _sorted_rows(self, selection):
+        if selection not in self._sorted:
+            rows = self.selection_rows[selection]
+            by_fare = rows[np.argsort(self.fare[rows], kind='stable')]
+            self._sorted[selection] = {}
+            for value in (0, 1):
+                value_rows = by_fare[self.survived[by_fare] == value]
+                self._sorted[selection][value] = (value_rows, self.fare[value_rows])
+        return self._sorted[selection]
+
+    # Aggregates keyed by (bin, Survived, Pclass) with count and fare/age/male sums
+    def _pyramid(self, selection):
+        if selection not in self._levels:
+            rows = self.selection_rows[selection]
+            n_classes = len(self.classes)
+            key = (self._bins(self.fare[rows], MAX_LEVEL) * 2 + self.survived[rows]) * n_classes + self.class_codes[rows]
+            size = (1 << MAX_LEVEL) * 2 * n_classes
+            count = np.bincount(key, minlength=size)
+            keys = np.flatnonzero(count)
+            finest = {
+                'key': keys,
+                'count': count[keys],
+                'fare': np.bincount(key, weights=self.fare[rows], minlength=size)[keys],
+                'age': np.bincount(key, weights=self.age[rows], minlength=size)[keys],
+                'male': np.bincount(key, weights=self.is_male[rows], minlength=size)[keys],
+            }
+            levels = {MAX_LEVEL: finest}
+            for level in range(MAX_LEVEL - 1, MIN_LEVEL - 1, -1):
+                levels[level] = self._coarsen(levels[level + 1], n_classes)
+            self._levels[selection] = levels
+        return self._levels[selection]
+
+    @staticmethod
+    def _coarsen(finer, n_classes):
+        rest = finer['key'] % (2 * n_classes)
+        key = (finer['key'] // (2 * n_classes)) // 2 * (2 * n_classes) + rest
+        unique, inverse = np.unique(key, return_inverse=True)
+        coarse = {'key': unique}
+        for name in ('count', 'fare', 'age', 'male'):
+            coarse[name] = np.bincount(inverse, weights=finer[name], minlength=len(unique))
+        coarse['count'] = coarse['count'].astype(np.int64)
+        return coarse
+
+    def _raw(self, sorted_rows, x0, x1, survived_values):
+        parts = []
+        for value in survived_values:
+            rows, fares = sorted_rows[value]
+            parts.append(rows[np.searchsorted(fares, x0, 'left'):np.searchsorted(fares, x1, 'right')])
+        rows = np.concatenate(parts) if parts else np.array([], dtype=np.intp)
+        data = {name: values[rows] for name, values in self.columns.items()}
+        data['size'] = np.full(len(rows), 10.0)
+        data['count'] = np.ones(len(rows), dtype=np.int64)
+        return data
+
+    def _aggregated(self, selection, x0, x1, survived_values):
+        n_classes = len(self.classes)
+        width = max(x1 - x0, self.fare_span / (1 << MAX_LEVEL)) / self.target_bins
+        level = int(np.clip(np.floor(np.log2(self.fare_span / width)), MIN_LEVEL, MAX_LEVEL))
+        agg = self._pyramid(selection)[level]
+
+        fare_bin = agg['key'] // (2 * n_classes)
+        survived = (agg['key'] // n_classes) % 2
+        first, last = self._bins(np.array([x0, x1]), level)
+        keep = (fare_bin >= first) & (fare_bin <= last) & np.isin(survived, survived_values)
+
+        count = agg['count'][keep]
+        male_share = agg['male'][keep] / count
+        return {
+            'Fare': agg['fare'][keep] / count,
+            'Survived': survived[keep],
+            'Pclass': self.classes[agg['key'][keep] % n_classes],
+            'Sex': np.where(male_share == 1, 'male', np.where(male_share == 0, 'female', 'mixed')),
+            'Age': np.round(agg['age'][keep] / count, 1),
+            'Name': np.char.add(count.astype(str), ' passengers'),
+            'size': 6 + 4 * np.log10(count),
+            'count': count,
+        }
+
+    # Points for the viewport [x0, x1] x [y0, y1] of one (class, gender) selection
+    def query(self, selection, x0=None, x1=None, y0=None, y1=None):
+        x0 = self.fare_min if x0 is None else x0
+        x1 = self.fare_max if x1 is None else x1
+        survived_values = [value for value in (0, 1) if (y0 is None or y0 <= value) and (y1 is None or value <= y1)]
+
+        sorted_rows = self._sorted_rows(selection)
+        visible = sum(np.searchsorted(sorted_rows[value][1], x1, 'right') - np.searchsorted(sorted_rows[value][1], x0, 'left')
+                      for value in survived_values)
+        if visible <= self.raw_limit:
+            return self._raw(sorted_rows, x0, x1, survived_values)
+        return self._aggregated(selection, x0, x1, survived_values)
@@ -0,0 +1,203 @@
+# Opt-in instrumentation of the report pipeline.
+#
+# Spans mark the load, transform, render and write stages of both report modules (read_csv,
+# cache loads, aggregations, plot functions, savefig, Bokeh save, update callbacks). A span
+# records its wall time, the row count of the frame it worked on and the change of the
+# process' resident memory. Everything is off (and costs one flag check) unless enabled:
+#
+#   REPORT_TRACE=trace.json python matplotlib_practical_task.py     # Chrome/Perfetto trace
+#   REPORT_TRACE_SUMMARY=1 python Bokeh_practical_tasks.py           # text summary on exit
+#   REPORT_PROFILE=plot_reviews_by_room_type python render_reports.py -j 1
+#                                                                    # cProfile of one span
+#
+# render_reports.py offers the same as --trace, --summary and --profile and collects the
+# spans of its worker processes, which show up as separate tracks in the trace.
+
+import atexit
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+_config = {'enabled': False, 'trace': None, 'summary': False, 'profile': None, 'profile_dir': None}
+_spans = []
+_lock = threading.Lock()
+
+
+def _page_size():
+    try:
+        return os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+_PAGE_SIZE = _page_size()
+
+
+# Current resident set size in bytes (Linux /proc), None where it is not available
+def _rss():
+    if _PAGE_SIZE is None:
+        return None
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+# Turn instrumentation on. trace: Chrome trace file written at exit, summary: print the text
+# summary at exit, profile: name of the one span to run under cProfile, profile_dir: where
+# its <span>.prof goes (default: next to the trace, else the current directory).
+def configure(trace=None, summary=False, profile=None, enabled=True, at_exit=True, profile_dir=None):
+    if profile_dir is None and trace:
+        profile_dir = os.path.dirname(os.path.abspath(trace))
+    _config.update(enabled=enabled or bool(trace or summary or profile), trace=trace,
+                   summary=summary, profile=profile, profile_dir=profile_dir)
+    if at_exit and (trace or summary) and not _config.get('exit_hook'):
+        _config['exit_hook'] = True
+        atexit.register(_write_at_exit)
+
+
+def enabled():
+    return _config['enabled']
+
+
+# Settings to hand to a worker process, see configure(**settings())
+def settings():
+    return {'enabled': _config['enabled'], 'profile': _config['profile'], 'profile_dir': _config['profile_dir']}
+
+
+def _configure_from_environment():
+    trace = os.environ.get('REPORT_TRACE')
+    summary = os.environ.get('REPORT_TRACE_SUMMARY', '') not in ('', '0')
+    profile = os.environ.get('REPORT_PROFILE')
+    if trace or summary or profile:
+        configure(trace=trace, summary=summary, profile=profile)
+
+
+# Measure the enclosed block. Yields the span's args dict, so the block can fill in values
+# only known at the end: `with span('read_csv', 'load') as info: ...; info['rows'] = len(df)`
+@contextmanager
+def span(name, stage, rows=None, **args):
+    args['rows'] = rows
+    if not _config['enabled']:
+        yield args
+        return
+
+    profiler = cProfile.Profile() if name == _config['profile'] else None
+    rss_before = _rss()
+    start_ts = time.time_ns() // 1000
+    start = time.perf_counter_ns()
+    if profiler:
+        profiler.enable()
+    try:
+        yield args
+    finally:
+        if profiler:
+            profiler.disable()
+        duration = (time.perf_counter_ns() - start) // 1000
+        rss_after = _rss()
+        record = {
+            'name': name,
+            'cat': stage,
+            'ph': 'X',
+            'ts': start_ts,
+            'dur': duration,
+            'pid': os.getpid(),
+            'tid': threading.get_ident() % 2 ** 31,
+            'args': dict(args, mem_delta=None if rss_before is None else rss_after - rss_before),
+        }
+        with _lock:
+            _spans.append(record)
+        if profiler:
+            _dump_profile(name, profiler)
+
+
+def _rows_of(value):
+    shape = getattr(value, 'shape', None)
+    return int(shape[0]) if shape else None
+
+
+# Decorator form of span(); rows are taken from the first argument if it is a frame or array
+def traced(stage, name=None):
+    def decorate(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _config['enabled']:
+                return func(*args, **kwargs)
+            with span(span_name, stage, rows=_rows_of(args[0]) if args else None):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def _dump_profile(name, profiler):
+    path = os.path.join(_config['profile_dir'] or '', f'{name}.prof')
+    profiler.dump_stats(path)
+    text = io.StringIO()
+    pstats.Stats(profiler, stream=text).sort_stats('cumulative').print_stats(25)
+    print(f'cProfile of {name} written to {path}\n{text.getvalue()}', file=sys.stderr)
+
+
+# Spans recorded so far (e.g. to send them from a worker process to its parent)
+def spans():
+    with _lock:
+        return list(_spans)
+
+
+def add_spans(records):
+    with _lock:
+        _spans.extend(records)
+
+
+def reset():
+    with _lock:
+        _spans.clear()
+
+
+def export_chrome_trace(path, records=None):
+    records = spans() if records is None else records
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': records, 'displayTimeUnit': 'ms'}, f)
+    return path
+
+
+# Plain-text table per (stage, span name): calls, total/mean/max time, rows, memory delta
+def summary(records=None):
+    records = spans() if records is None else records
+    groups = {}
+    for record in records:
+        group = groups.setdefault((record['cat'], record['name']), {'calls': 0, 'total': 0, 'max': 0, 'rows': None, 'mem': 0})
+        group['calls'] += 1
+        group['total'] += record['dur']
+        group['max'] = max(group['max'], record['dur'])
+        if record['args'].get('rows') is not None:
+            group['rows'] = max(group['rows'] or 0, record['args']['rows'])
+        group['mem'] += record['args'].get('mem_delta') or 0
+
+    lines = [f"{'stage':10} {'span':70} {'calls':>5} {'total s':>9} {'mean ms':>9} {'max ms':>9} {'rows':>10} {'mem MiB':>8}"]
+    for (stage, name), group in sorted(groups.items(), key=lambda item: -item[1]['total']):
+        rows = '' if group['rows'] is None else str(group['rows'])
+        lines.append(f"{stage:10} {name:70} {group['calls']:5} {group['total'] / 1e6:9.3f} "
+                     f"{group['total'] / group['calls'] / 1e3:9.2f} {group['max'] / 1e3:9.2f} {rows:>10} "
+                     f"{group['mem'] / 2 ** 20:8.1f}")
+    return '\n'.join(lines)
+
+
+def _write_at_exit():
+    if _config['trace']:
+        export_chrome_trace(_config['trace'])
+        print(f"trace with {len(_spans)} spans written to {_config['trace']}", file=sys.stderr)
+    if _config['summary']:
+        print(summary(), file=sys.stderr)
+
+
+_configure_from_environment()
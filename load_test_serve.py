@@ -0,0 +1,285 @@
+# Load test of the `bokeh serve` deployment of Bokeh_practical_tasks.py.
+#
+#   python load_test_serve.py                          # 20 sessions, 10 changes each
+#   python load_test_serve.py -n 100 --changes 30 --dashboard -o load_results.json
+#   python load_test_serve.py --app titanic_dashboard  # the directory app
+#
+# Starts the app with `bokeh serve` on a free localhost port and opens N sessions with
+# bokeh.client, one thread (and websocket) per session. Every session then sets random
+# values on its Class/Gender Select widgets; a change counts as answered when the server's
+# update (the patched source or filter, sent after the update pool has computed it) arrives
+# back in the client document. Reported:
+#   session creation   pull_session() until the session document is on the client (all
+#                      sessions open at once unless --ramp spreads them out)
+#   round trip         Select change sent -> server's patch applied, p50/p99/max
+#   server RSS         before the sessions (after one warm-up page load, which builds the
+#                      shared data), with all sessions open and the growth per session
+# The clients run in this process, so the numbers include their share of the machine.
+#
+# Waiting for the server's answer needs private bokeh.client internals (the session's
+# connection and its _loop_until / io_loop): the public synchronous client only reads the
+# websocket inside a blocking call, and its request/reply wait (force_roundtrip) drops
+# PATCH-DOC messages. The harness is therefore pinned to the Bokeh release it was written
+# against (TESTED_BOKEH) and refuses to run when those internals are missing.
+
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import bokeh
+import numpy as np
+from bokeh.client import pull_session
+from bokeh.client.connection import ClientConnection
+from bokeh.models import Select
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+SELECT_TITLES = ('Passenger Class', 'Gender')
+
+# Bokeh release (major.minor) whose client internals SimulatedSession.change relies on
+TESTED_BOKEH = '3.9'
+
+
+# Make sure the installed Bokeh still has the client internals the harness uses; a
+# different release only warns, as long as they are there
+def check_bokeh():
+    missing = [name for name in ('_loop_until', 'io_loop') if not hasattr(ClientConnection, name)]
+    if missing:
+        raise SystemExit(f"bokeh {bokeh.__version__}: ClientConnection has no {', '.join(missing)}; "
+                         f"load_test_serve.py needs bokeh {TESTED_BOKEH}.x")
+    if not bokeh.__version__.startswith(TESTED_BOKEH + '.'):
+        print(f'warning: load_test_serve.py is tested with bokeh {TESTED_BOKEH}.x, found {bokeh.__version__}',
+              file=sys.stderr)
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('localhost', 0))
+        return sock.getsockname()[1]
+
+
+# Resident set size of another process in bytes (Linux /proc), None where it is not available
+def process_rss(pid):
+    try:
+        with open(f'/proc/{pid}/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+# Start `bokeh serve app` and wait until its page loads; returns (process, app url, log file)
+def start_server(app, port, dashboard=False, timeout=120):
+    app_path = os.path.join(script_dir, app)
+    name = os.path.splitext(os.path.basename(app_path.rstrip('/')))[0]
+    command = [sys.executable, '-m', 'bokeh', 'serve', app_path, '--port', str(port),
+               '--allow-websocket-origin', f'localhost:{port}']
+    if dashboard:
+        command += ['--args', '--dashboard']
+    log = tempfile.NamedTemporaryFile(prefix='bokeh_serve_', suffix='.log', delete=False)
+    process = subprocess.Popen(command, cwd=script_dir, stdout=log, stderr=subprocess.STDOUT)
+    url = f'http://localhost:{port}/{name}'
+
+    deadline = time.monotonic() + timeout
+    while True:
+        if process.poll() is not None:
+            raise RuntimeError(f'bokeh serve exited with {process.returncode}, see {log.name}')
+        try:
+            with urllib.request.urlopen(url, timeout=timeout) as response:
+                response.read()
+            return process, url, log.name
+        except (urllib.error.URLError, ConnectionError):
+            if time.monotonic() > deadline:
+                process.kill()
+                raise RuntimeError(f'bokeh serve did not answer within {timeout} s, see {log.name}')
+            time.sleep(0.2)
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+class SimulatedSession:
+    def __init__(self, url, rng, timeout):
+        self.url = url
+        self.rng = rng
+        self.timeout = timeout
+        self.session = None
+        self.created = None
+        self.round_trips = []
+        self.timeouts = 0
+        self.error = None
+        self._answered = False
+
+    def connect(self):
+        start = time.perf_counter()
+        self.session = pull_session(url=self.url)
+        self.created = time.perf_counter() - start
+        self.selects = [s for s in self.session.document.select({'type': Select}) if s.title in SELECT_TITLES]
+        self.session.document.on_change(self._document_changed)
+
+    def _document_changed(self, event):
+        if getattr(event, 'setter', None) is self.session:  # applied from a server patch
+            self._answered = True
+
+    # Set one random Select to another value and wait for the server's answer (drives the
+    # connection's loop through private internals, see check_bokeh)
+    def change(self):
+        select = self.rng.choice(self.selects)
+        value = self.rng.choice([option for option in select.options if option != select.value])
+        connection = self.session._connection
+        self._answered = False
+        timer = connection.io_loop.call_later(self.timeout, self.session.close)
+        start = time.perf_counter()
+        select.value = value
+        connection._loop_until(lambda: self._answered or not self.session.connected)
+        seconds = time.perf_counter() - start
+        connection.io_loop.remove_timeout(timer)
+        if not self._answered:
+            self.timeouts += 1
+            return False
+        self.round_trips.append(seconds)
+        return True
+
+    def close(self):
+        if self.session is not None and self.session.connected:
+            self.session.close()
+
+
+def _percentiles(values):
+    if not values:
+        return None
+    values = np.asarray(values) * 1000
+    return {'count': len(values), 'p50_ms': float(np.percentile(values, 50)),
+            'p99_ms': float(np.percentile(values, 99)), 'max_ms': float(values.max())}
+
+
+def run_load_test(sessions=20, changes=10, app='Bokeh_practical_tasks.py', dashboard=False, port=None,
+                  think=0.0, timeout=10.0, seed=0, ramp=0.0):
+    process, url, log_path = start_server(app, port or _free_port(), dashboard)
+    simulated = [SimulatedSession(url, random.Random(seed + i), timeout) for i in range(sessions)]
+    opened = threading.Barrier(sessions + 1)
+    measured = threading.Barrier(sessions + 1)
+
+    def drive(index, session):
+        time.sleep(ramp * index / sessions)
+        try:
+            session.connect()
+        except Exception as error:  # reported, the other sessions go on
+            session.error = repr(error)
+        opened.wait()
+        measured.wait()
+        try:
+            for _ in range(changes if session.error is None else 0):
+                if not session.change():
+                    break  # the session was closed on timeout
+                if think:
+                    time.sleep(session.rng.uniform(0, think))
+        except Exception as error:
+            session.error = repr(error)
+        finally:
+            session.close()
+
+    try:
+        rss_before = process_rss(process.pid)
+        threads = [threading.Thread(target=drive, args=(i, session), daemon=True)
+                   for i, session in enumerate(simulated)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        opened.wait()
+        open_seconds = time.perf_counter() - start
+        rss_open = process_rss(process.pid)
+        measured.wait()
+        for thread in threads:
+            thread.join()
+        rss_after = process_rss(process.pid)
+    finally:
+        stop_server(process)
+
+    connected = [s for s in simulated if s.created is not None]
+    per_session = None
+    if rss_before is not None and rss_open is not None and connected:
+        per_session = (rss_open - rss_before) / len(connected)
+    return {
+        'meta': {
+            'app': app, 'dashboard': dashboard, 'sessions': sessions, 'changes': changes,
+            'ramp_s': ramp, 'think_s': think, 'timeout_s': timeout, 'seed': seed, 'cpu_count': os.cpu_count(),
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'), 'server_log': log_path,
+        },
+        'session_creation': _percentiles([s.created for s in connected]),
+        'all_sessions_open_s': open_seconds,
+        'round_trip': _percentiles([t for s in simulated for t in s.round_trips]),
+        'timeouts': sum(s.timeouts for s in simulated),
+        'errors': [s.error for s in simulated if s.error],
+        'server_rss': {'before': rss_before, 'sessions_open': rss_open, 'after': rss_after,
+                       'per_session': per_session},
+    }
+
+
+def print_report(result):
+    meta = result['meta']
+    print(f"{meta['app']}{' --dashboard' if meta['dashboard'] else ''}: {meta['sessions']} sessions, "
+          f"{meta['changes']} changes each")
+    for label, key in (('session creation', 'session_creation'), ('round trip', 'round_trip')):
+        stats = result[key]
+        if stats is None:
+            print(f'{label:18} no samples')
+            continue
+        print(f"{label:18} n={stats['count']:<6} p50 {stats['p50_ms']:8.1f} ms  p99 {stats['p99_ms']:8.1f} ms  "
+              f"max {stats['max_ms']:8.1f} ms")
+    print(f"{'all sessions open':18} {result['all_sessions_open_s']:.2f} s")
+    rss = result['server_rss']
+    if rss['before'] is not None:
+        mib = 2 ** 20
+        print(f"{'server RSS':18} {rss['before'] / mib:.1f} MiB before, {rss['sessions_open'] / mib:.1f} MiB "
+              f"with sessions open, {rss['after'] / mib:.1f} MiB after")
+        if rss['per_session'] is not None:
+            print(f"{'RSS per session':18} {rss['per_session'] / mib:.2f} MiB")
+    if result['timeouts']:
+        print(f"{result['timeouts']} changes got no answer within {meta['timeout_s']} s")
+    for error in result['errors']:
+        print(f'session error: {error}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load test the bokeh serve deployment of the Titanic charts.')
+    parser.add_argument('-n', '--sessions', type=int, default=20, help='simulated sessions (default: 20)')
+    parser.add_argument('--changes', type=int, default=10, help='Select changes per session (default: 10)')
+    parser.add_argument('--app', default='Bokeh_practical_tasks.py', help='app file or directory to serve')
+    parser.add_argument('--dashboard', action='store_true', help='serve the combined dashboard (--args --dashboard)')
+    parser.add_argument('--port', type=int, default=None, help='default: a free port')
+    parser.add_argument('--ramp', type=float, default=0.0,
+                        help='spread the session starts over this many seconds (default: all at once)')
+    parser.add_argument('--think', type=float, default=0.0, help='max random pause between changes, in seconds')
+    parser.add_argument('--timeout', type=float, default=10.0, help='seconds to wait for the answer to a change')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', default=None, help='also write the results as JSON')
+    args = parser.parse_args(argv)
+
+    check_bokeh()
+    result = run_load_test(args.sessions, args.changes, args.app, args.dashboard, args.port,
+                           args.think, args.timeout, args.seed, args.ramp)
+    print_report(result)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=1)
+        print(f'results written to {args.output}')
+    return 1 if result['timeouts'] or result['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
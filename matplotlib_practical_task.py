@@ -1,8 +1,17 @@
-import pandas as pd
 import matplotlib.pyplot as plt
+from matplotlib.colors import LogNorm, to_rgb
 import os
+import sys
+import inspect
 import numpy as np
 
+from airbnb_data import PLOT_FILES, basemap_file, load_listings, load_plot_data, plot_data_digest
+from airbnb_aggregates import AVAILABILITY_BIN_EDGES, CUBE_COLUMNS, JOINT_SHAPE, PRICE_BIN_EDGES, cube_for, daily_reviews_for, listing_grid_for
+from data_schema import code_of, codes, encode
+from render_cache import RenderCache
+from spatial_index import NYC_EXTENT
+from instrumentation import traced
+
 script_dir = os.path.dirname(os.path.abspath(__file__))
 source_path = script_dir + '/AirBnB_NY/'
 #print('THE SOURCE PATH = ' + source_path)
@@ -10,19 +19,29 @@ source_path = script_dir + '/AirBnB_NY/'
 plots_dest_path = script_dir + '/plots/'
 #print('THE PLOTS PATH = ' + plots_dest_path)
 
-df = pd.read_csv(source_path + 'AB_NYC_2019.csv')
 
+# PNG encoding and writing is measured as its own 'write' span (see instrumentation)
+savefig = traced('write', name='savefig')(plt.savefig)
 
 
+# The listings are loaded lazily on first access of `df` (see airbnb_data.load_listings),
+# so importing a single plot function no longer parses the whole CSV.
+def __getattr__(name):
+    if name == 'df':
+        return load_listings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-listings_count = df['neighbourhood_group'].value_counts() # Listings count by every neighbourhood group:
-#print(listings_count)
 
 # - Plot: Create a bar plot to show the distribution of listings across different
 # neighbourhood_group.
 # - Details: Label each bar with the count of listings, use distinct colors for each
 # neighborhood group, and add titles and axis labels.
-def plot_listing_across_neighbourhood_groups(df, plots_dest_path):
+@traced('render')
+def plot_listing_across_neighbourhood_groups(df, plots_dest_path, show=True, cube=None):
+    cube = cube if cube is not None else cube_for(df)
+    listings_count = cube.counts().sort_values(ascending=False) # Listings count by every neighbourhood group:
+    #print(listings_count)
+
     plt.figure(figsize=(10, 6))
 
     colors = ['lightblue', 'lightgreen', 'lightgrey', 'lightpink', 'skyblue']
@@ -38,37 +57,42 @@ def plot_listing_across_neighbourhood_groups(df, plots_dest_path):
         yval = bar.get_height()
         plt.text(bar.get_x() + bar.get_width()/2, yval + 0.5, int(yval), ha='center', va='bottom')
 
-    plt.savefig(plots_dest_path + 'listing_across_neighbourhood_groups.png')
-    plt.show()
+    savefig(plots_dest_path + 'listing_across_neighbourhood_groups.png')
+    if show:
+        plt.show()
 
 
 # - Plot: Generate a box plot to display the distribution of price within each
 # neighbourhood_group.
 # - Details: Use different colors for the box plots, highlight outliers, and add
 # appropriate titles and axis labels.
-def plot_price_distrubution_by_neighbourhood_group(df, plots_dest_path):
+@traced('render')
+def plot_price_distrubution_by_neighbourhood_group(df, plots_dest_path, show=True, cube=None):
+    cube = cube if cube is not None else cube_for(df)
+    # Colors keep following the groups as they were first listed in AB_NYC_2019.csv, although
+    # the boxes are now in the schema (sorted) order; groups of other dumps take the rest
     colors = ['lightblue', 'lightgreen', 'lightcoral', 'red', 'yellow']
+    group_colors = dict(zip(['Brooklyn', 'Manhattan', 'Queens', 'Staten Island', 'Bronx'], colors))
+    spare_colors = iter(colors)
 
-    # Prepare the data for the boxplot
-    data_to_plot = [df[df['neighbourhood_group'] == group]['price'] for group in df['neighbourhood_group'].unique()]
+    # Quartiles, whiskers and outliers per group come from the cube's price sketch
+    box_stats = cube.box_stats('price')
 
     # Create the box plot
     plt.figure(figsize=(10, 12))
-    box = plt.boxplot(data_to_plot,
-                    patch_artist=True,
-                    labels=df['neighbourhood_group'].unique()
-                    )
+    box = plt.gca().bxp(box_stats, patch_artist=True)
 
     # Color each box differently
-    for patch, color in zip(box['boxes'], colors):
-        patch.set_facecolor(color)
+    for patch, stats in zip(box['boxes'], box_stats):
+        patch.set_facecolor(group_colors.get(stats['label']) or next(spare_colors, 'lightgrey'))
 
     plt.title('Price Distribution by Neighbourhood Group')
     plt.xlabel('Neighbourhood Group')
     plt.ylabel('Price')
 
-    plt.savefig(plots_dest_path + 'price_distrubution_by_neighbourhood_group.png')
-    plt.show()
+    savefig(plots_dest_path + 'price_distrubution_by_neighbourhood_group.png')
+    if show:
+        plt.show()
 
 
 # - Plot: Create a grouped bar plot to show the average availability_365 for each
@@ -76,17 +100,19 @@ def plot_price_distrubution_by_neighbourhood_group(df, plots_dest_path):
 # - Details: Include error bars to indicate the standard deviation, use different colors
 # for room types, and add titles and axis labels.
 
-def plot_average_availability_by_room_type_across_neighbourhoods(df, plots_dest_path):
-    # Calculate mean of availability_365 for each room_type across neighbourhood_group
-    grouped_df = df.groupby(['neighbourhood_group', 'room_type']).agg(mean_availability=('availability_365', 'mean'),
-                                                                    std_availability=('availability_365', 'std')
-                                                                    ).reset_index()
+@traced('render')
+def plot_average_availability_by_room_type_across_neighbourhoods(df, plots_dest_path, show=True, cube=None):
+    cube = cube if cube is not None else cube_for(df)
+
+    # Mean and std of availability_365 for each room_type across neighbourhood_group
+    mean_availability = cube.mean('availability_365')
+    std_availability = cube.std('availability_365')
 
     plt.figure(figsize=(14, 8))
 
     # Retrive unique values for neighborhoods and room_types
-    neighbourhoods = grouped_df['neighbourhood_group'].unique()
-    room_types = grouped_df['room_type'].unique()
+    neighbourhoods = mean_availability.index
+    room_types = mean_availability.columns
 
     # Define bar width and positions
     bar_width = 0.2
@@ -94,10 +120,9 @@ def plot_average_availability_by_room_type_across_neighbourhoods(df, plots_dest_
 
     # Create bars for each room type
     for i, room_type in enumerate(room_types): #0 Entire home/apt, 1 Private room, 2 Shared room
-        subset = grouped_df[grouped_df['room_type'] == room_type]
         plt.bar(index + i * bar_width,         # x
-                subset['mean_availability'],   # y
-                yerr=subset['std_availability'],    #error bar
+                mean_availability[room_type],   # y
+                yerr=std_availability[room_type],    #error bar
                 width=bar_width,
                 label=room_type,
                 capsize=7)  # Adds caps to the error bars
@@ -109,8 +134,9 @@ def plot_average_availability_by_room_type_across_neighbourhoods(df, plots_dest_
     plt.xticks(index + bar_width, neighbourhoods)  # Add lables to the x axis (neighbourhoods)
     plt.legend(title='Room Type')
 
-    plt.savefig(plots_dest_path + 'average_availability_by_room_type_across_neighbourhoods.png')
-    plt.show()
+    savefig(plots_dest_path + 'average_availability_by_room_type_across_neighbourhoods.png')
+    if show:
+        plt.show()
 
 
 # - Plot: Develop a scatter plot with price on the x-axis and number_of_reviews on the
@@ -118,66 +144,115 @@ def plot_average_availability_by_room_type_across_neighbourhoods(df, plots_dest_
 # - Details: Differentiate points by room_type using color or marker style, add a
 # regression line to identify trends, and include a legend, titles, and axis labels.
 
-def plot_price_vs_Number_of_reviews_room_type(df, plots_dest_path):
+# Above this many listings the scatter is drawn as a density raster instead of one marker per
+# listing: matplotlib's per-marker cost grows with N, a fixed-size raster does not.
+DENSITY_THRESHOLD = 200_000
+DENSITY_BINS = (400, 300)  # (price bins, number_of_reviews bins)
+
+
+# Bin every listing into a (room_type, price bin, reviews bin) grid with a single np.bincount
+# over integer codes and draw one RGBA image per room type (opacity ~ log of the count).
+def _draw_price_reviews_density(df, cube, colors):
+    room = encode('room_type', df['room_type'])
+    room_codes = codes(room)
+    room_types = list(room.cat.categories)
+    # Integer-valued axes never get more bins than distinct values, so no empty stripes appear
+    x_max = cube.maximum('price').max().max() + 1
+    y_max = cube.maximum('number_of_reviews').max().max() + 1
+    nx, ny = min(DENSITY_BINS[0], int(x_max)), min(DENSITY_BINS[1], int(y_max))
+
+    x_bins = np.minimum((df['price'].to_numpy() * (nx / x_max)).astype(np.intp), nx - 1)
+    y_bins = np.minimum((df['number_of_reviews'].to_numpy() * (ny / y_max)).astype(np.intp), ny - 1)
+    valid = room_codes >= 0
+    flat = (room_codes[valid].astype(np.intp) * ny + y_bins[valid]) * nx + x_bins[valid]
+    counts = np.bincount(flat, minlength=len(room_types) * ny * nx).reshape(len(room_types), ny, nx)
+
+    for code, room_type in enumerate(room_types):
+        if not counts[code].any():
+            continue
+        image = np.zeros((ny, nx, 4))
+        image[..., :3] = to_rgb(colors.get(room_type, 'grey'))
+        image[..., 3] = np.log1p(counts[code]) / np.log1p(counts[code].max())
+        plt.imshow(image, origin='lower', extent=(0, x_max, 0, y_max), aspect='auto', interpolation='nearest')
+
+
+@traced('render')
+def plot_price_vs_Number_of_reviews_room_type(df, plots_dest_path, show=True, cube=None, mode='auto'):
+    cube = cube if cube is not None else cube_for(df)
+    regression = cube.regression()
+
     # Define colors and markers for each room type
     colors = {'Entire home/apt': 'blue', 'Private room': 'green', 'Shared room': 'coral'}
     markers = {'Entire home/apt': 'o', 'Private room': 's', 'Shared room': 'D'}
 
+    # 'scatter' draws every listing, 'density' a binned raster, 'auto' picks by row count
+    if mode == 'auto':
+        mode = 'density' if len(df) > DENSITY_THRESHOLD else 'scatter'
+
     plt.figure(figsize = (12, 10))
 
+    room_types = [room_type for room_type, n in cube.counts(by=None).sum().items() if n > 0]
 
-    room_types = df['room_type'].unique()
+    if mode == 'density':
+        _draw_price_reviews_density(df, cube, colors)
+    else:
+        # Room types are compared as integer codes, one mask per room type
+        room = encode('room_type', df['room_type'])
+        room_codes = codes(room)
+        price, reviews = df['price'].to_numpy(), df['number_of_reviews'].to_numpy()
 
     for room_type in room_types:
-        subset = df[df['room_type'] == room_type]
-        plt.scatter(subset['price'],               # x
-                    subset['number_of_reviews'],   # y
-                    color = colors[room_type],
-                    marker = markers[room_type],
-                    label=room_type,
-                    s = 10   # size of figures displayed
+        if mode == 'density':
+            # Empty scatter as legend entry for the raster of this room type
+            plt.scatter([], [], color=colors[room_type], marker=markers[room_type], label=room_type, s=10)
+        else:
+            mask = room_codes == code_of(room, room_type)
+            plt.scatter(price[mask],     # x
+                        reviews[mask],   # y
+                        color = colors[room_type],
+                        marker = markers[room_type],
+                        label=room_type,
+                        s = 10   # size of figures displayed
 
-                )
+                    )
 
-        # Add a regression line for each room type
-        slope, intercept = np.polyfit(subset['price'], subset['number_of_reviews'], 1)
-        plt.plot(subset['price'], slope * subset['price'] + intercept, color=colors[room_type], linestyle='--')
+        # Add a regression line for each room type, fitted from the cube's sums
+        slope, intercept = regression.loc[room_type]
+        price_range = np.array([cube.minimum('price')[room_type].min(), cube.maximum('price')[room_type].max()])
+        plt.plot(price_range, slope * price_range + intercept, color=colors[room_type], linestyle='--')
 
     plt.title('Price vs. Number of Reviews by Room Type')
     plt.xlabel('Price')
     plt.ylabel('Number of Reviews')
     plt.legend(title='Room Type')
 
-    plt.savefig(plots_dest_path + 'price_vs_number_of_reviews_by_room_type.png')
-    plt.show()
+    savefig(plots_dest_path + 'price_vs_number_of_reviews_by_room_type.png')
+    if show:
+        plt.show()
 
 
 # - Plot: Create a line plot to show the trend of number_of_reviews over time
 # (last_review) for each neighbourhood_group.
 # - Details: Use different colors for each neighborhood group, smooth the data with a
 # rolling average, and add titles, axis labels, and a legend.
-def plot_trend_number_of_reviews_over_last_review_foreach_neighbourhood(df, plots_dest_path):
-    df_cut = df.copy() # made a copy of original DataFrame just for cut a banch of dates which not play a
-                       # significant role and make better line plot (more inform)
-
-    df_cut = df_cut[df_cut['last_review'] >= '2018-11-01']  # cut DataFrame
-
-    df_cut['last_review'] = pd.to_datetime(df['last_review'])
-    df_cut = df_cut.dropna(subset=['last_review'])
-
-    # Group by neighbourhood_group and last_review, then sum the number of reviews
-    grouped_df = df_cut.groupby(['neighbourhood_group', 'last_review']).agg({'number_of_reviews': 'sum'}).reset_index()
+@traced('render')
+def plot_trend_number_of_reviews_over_last_review_foreach_neighbourhood(df, plots_dest_path, show=True, daily=None,
+                                                                        window=2, start='2018-11-01'):
+    # Dense (date x neighbourhood_group) matrix of the summed number of reviews, built once per df;
+    # `daily` can be passed in precomputed, e.g. merged from chunks by airbnb_stream
+    daily = daily if daily is not None else daily_reviews_for(df)
 
-    # apply a rolling average
-    grouped_df['rolling_avg_reviews'] = grouped_df.groupby('neighbourhood_group')['number_of_reviews'].rolling(window=2, min_periods=1).mean().reset_index(level=0, drop=True)
+    # start cuts a banch of dates which not play a significant role and make better line plot (more inform);
+    # the rolling average is memoized per (window, start), so changing them does not regroup the data
+    rolling_avg_reviews = daily.rolling(window=window, start=start)
 
     # plotting
     plt.figure(figsize=(14, 8))
 
     # plot each neighbourhood_group
-    for neighbourhood in grouped_df['neighbourhood_group'].unique():
-        subset = grouped_df[grouped_df['neighbourhood_group'] == neighbourhood]
-        plt.plot(subset['last_review'], subset['rolling_avg_reviews'], label=neighbourhood)
+    for neighbourhood in rolling_avg_reviews.columns:
+        subset = rolling_avg_reviews[neighbourhood].dropna()
+        plt.plot(subset.index, subset.values, label=neighbourhood)
 
     # Add titles,labels and legend
     plt.title('Trend of Number of Reviews Over Time by Neighbourhood Group')
@@ -185,8 +260,9 @@ def plot_trend_number_of_reviews_over_last_review_foreach_neighbourhood(df, plot
     plt.ylabel('Rolling Average of Number of Reviews')
     plt.legend(title='Neighbourhood Group')
 
-    plt.savefig(plots_dest_path + 'trend_of_number_of_reviews_over_time_by_neighbourhood_group.png')
-    plt.show()
+    savefig(plots_dest_path + 'trend_of_number_of_reviews_over_time_by_neighbourhood_group.png')
+    if show:
+        plt.show()
 
 
 # - Plot: Generate a heatmap to visualize the relationship between price and
@@ -194,46 +270,70 @@ def plot_trend_number_of_reviews_over_last_review_foreach_neighbourhood(df, plot
 # - Details: Use a color gradient to represent the intensity of the relationship, label the
 # axes, and include a color bar for reference.
 
-# Calculate the mean price and availability_365 for each neighbourhood_group
-def plot_relationship_between_price_availability_365_across_neighborhoods(df, plots_dest_path):
-    heatmap_data = df.groupby('neighbourhood_group').agg({
-        'price': 'mean',
-        'availability_365': 'mean'
-    }).reset_index()
-
-    heatmap_data['price'] = heatmap_data['price'].round(2)
-
-    # Pivot the data to create a matrix for the heatmap
-    heatmap_data_pivot = heatmap_data.pivot(index = 'neighbourhood_group', columns = 'price', values = 'availability_365')
+# Tick labels of the joint histogram bins (see airbnb_aggregates.JOINT_SHAPE); prices are
+# labelled at the decade edges 10, 100 and 1000 of every block
+AVAILABILITY_BIN_LABELS = ['0'] + [f'{lo}-{hi - 1}' for lo, hi in zip(AVAILABILITY_BIN_EDGES[1:-1], AVAILABILITY_BIN_EDGES[2:])]
+PRICE_TICKS = [k for k, edge in enumerate(PRICE_BIN_EDGES[:-1]) if np.isclose(edge, [10, 100, 1000]).any()]
+
+
+# Draw (price bin x availability bin) histograms, one or a stack of them (..., P, A), as a
+# single pcolormesh on bin-index axes (so the one-day bin of unavailable listings is as wide
+# as the others). Every histogram is colored by the share of its own listings and the
+# stacked ones are drawn as blocks of rows, bottom to top; returns the mesh.
+def draw_price_availability(ax, counts, vmax=None):
+    counts = np.asarray(counts).reshape((-1,) + JOINT_SHAPE)
+    share = 100 * counts / np.maximum(counts.sum(axis=(1, 2), keepdims=True), 1)
+    share = share.reshape(-1, JOINT_SHAPE[1])
+    mesh = ax.pcolormesh(np.ma.masked_equal(share, 0), cmap='YlGnBu', vmin=0, vmax=vmax or share.max() or 1,
+                         edgecolors='none')
+    ax.set_xticks(np.arange(len(AVAILABILITY_BIN_LABELS)) + 0.5, AVAILABILITY_BIN_LABELS, rotation=90, fontsize=7)
+    blocks = np.arange(len(counts)) * JOINT_SHAPE[0]
+    ax.set_yticks((blocks[:, None] + PRICE_TICKS).ravel(),
+                  [f'{PRICE_BIN_EDGES[k]:.0f}' for k in PRICE_TICKS] * len(counts), fontsize=7)
+    if len(counts) > 1:
+        ax.hlines(blocks[1:], 0, JOINT_SHAPE[1], colors='grey', linewidth=1)
+    return mesh
+
+
+# Joint distribution of price (log-scaled bins) and availability_365 of every
+# neighbourhood_group, from the cube's price x availability histogram: the groups' histograms
+# are stacked into one matrix and drawn as a single pcolormesh, colored by the share of each
+# group's listings
+@traced('render')
+def plot_relationship_between_price_availability_365_across_neighborhoods(df, plots_dest_path, show=True, cube=None):
+    cube = cube if cube is not None else cube_for(df)
+    histograms = {group: cube.price_availability(group) for group in cube.groups}
+    histograms = {group: counts for group, counts in histograms.items() if counts.any()}
 
     # Ploting
-    plt.figure(figsize=(10, 8))
+    fig, ax = plt.subplots(figsize=(8, 1.6 * len(histograms) + 2))
+    mesh = draw_price_availability(ax, np.stack(list(histograms.values())))
 
-    # Use the pcolormesh function to create the heatmap
-    plt.pcolormesh(heatmap_data_pivot, cmap='YlGnBu', edgecolors='black', shading='auto')
+    # name of every group in the top left corner of its block (prices above 1000 are rare)
+    for block, (group, counts) in enumerate(histograms.items()):
+        ax.text(0.2, (block + 1) * JOINT_SHAPE[0] - 0.5, f'{group} ({counts.sum()} listings)', va='top', fontsize=8)
 
     # Add color bar for reference
-    plt.colorbar(label='Average Availability (days)')
+    fig.colorbar(mesh, ax=ax, label='Share of Listings (%)')
 
     # Label the axes
-    plt.title('Heatmap of Price vs Availability Across Neighbourhoods')
-    plt.xlabel('Average Price')
-    plt.ylabel('Neighbourhood Group')
+    ax.set_title('Heatmap of Price vs Availability Across Neighbourhoods')
+    ax.set_xlabel('Availability (days)')
+    ax.set_ylabel('Price (log-scaled bins)')
 
-    # Adjust the ticks for x and y axis
-    plt.xticks(np.arange(0.5, len(heatmap_data_pivot.columns), 1), heatmap_data_pivot.columns) #allign on center lables axis x
-    plt.yticks(np.arange(0.5, len(heatmap_data_pivot.index), 1), heatmap_data_pivot.index)  # allign on center lables axis y
-
-    plt.savefig(plots_dest_path + 'heatmap_of_price_vs_availability_across_neighbourhoods.png')
-    plt.show()
+    savefig(plots_dest_path + 'heatmap_of_price_vs_availability_across_neighbourhoods.png')
+    if show:
+        plt.show()
 
 
 # - Plot: Create a stacked bar plot to display the number_of_reviews for each
 # room_type across the neighbourhood_group.
 # - Details: Stack the bars by room type, use different colors for each room type, and
 # add titles, axis labels, and a legend.
-def plot_reviews_by_room_type(df, plots_dest_path):
-    pivot_df = df.pivot_table(index='neighbourhood_group', columns='room_type', values='number_of_reviews', aggfunc='sum', fill_value=0)
+@traced('render')
+def plot_reviews_by_room_type(df, plots_dest_path, show=True, cube=None):
+    cube = cube if cube is not None else cube_for(df)
+    pivot_df = cube.total('number_of_reviews').astype('int64')
     #print(pivot_df)
 
     plt.figure(figsize=(10, 8))
@@ -249,16 +349,97 @@ def plot_reviews_by_room_type(df, plots_dest_path):
     plt.ylabel('Number of Reviews')
     plt.legend(title='Room Type')
 
-    plt.savefig(plots_dest_path + 'number_of_reviews_by_room_type_across_neighbourhoods.png')
-    plt.show()
+    savefig(plots_dest_path + 'number_of_reviews_by_room_type_across_neighbourhoods.png')
+    if show:
+        plt.show()
+
+
+# - Plot: Draw a density map of the listings (or of their average price or availability_365)
+# over the New York City basemap.
+# - Details: Read the raster from the precomputed grid index (see spatial_index), so the map
+# costs the same for any number of listings; leave empty cells transparent, use a log scale
+# for counts and add a color bar, title and axis labels.
+# - Options: area=('neighbourhood', 'Harlem') or ('neighbourhood_group', 'Brooklyn') maps the
+# listings of one area only (counts), bbox=[lon0, lon1, lat0, lat1] zooms the map into a
+# bounding box and reports how many of the mapped listings lie in it.
+
+MAP_TITLES = {
+    'count': ('Density of Listings', 'Number of Listings'),
+    'price': ('Average Price of Listings', 'Average Price'),
+    'availability_365': ('Average Availability of Listings', 'Average Availability (days)'),
+}
+
+
+# File name of a density map; maps of an area or a bounding box get their own file
+def density_map_file(measure='count', area=None, bbox=None):
+    name = 'listing_density_map' if measure == 'count' else f'listing_{measure}_map'
+    if area:
+        name += '_' + ''.join(c if c.isalnum() else '_' for c in area[1])
+    if bbox:
+        name += '_bbox_' + '_'.join(f'{v:.3f}' for v in bbox)
+    return name + '.png'
+
+
+@traced('render')
+def plot_listing_density_map(df, plots_dest_path, show=True, grid=None, measure='count', area=None, bbox=None):
+    grid = grid if grid is not None else listing_grid_for(df)
+    title, label = MAP_TITLES[measure]
+    if area:
+        if measure != 'count':
+            raise ValueError('Area maps show listing counts only')
+        name, area_label = area
+        raster, rows = grid.group_raster(name, area_label), grid.group_rows(name, area_label)
+        title += f' in {area_label}'
+    else:
+        raster, rows = grid.raster(measure), None
+    values = np.ma.masked_where(raster == 0 if area else grid.count == 0, raster)  # empty cells stay transparent
+
+    plt.figure(figsize=(10, 8))
+
+    with open(basemap_file, 'rb') as f:  # a JPEG file despite its name
+        plt.imshow(plt.imread(f, format='jpeg'), extent=NYC_EXTENT, zorder=0)
+
+    if measure == 'count':
+        norm = LogNorm(vmin=1, vmax=max(int(raster.max()), 2))
+    else:
+        # a few luxury listings would otherwise wash out the scale
+        norm = plt.Normalize(vmin=values.min(), vmax=np.percentile(values.compressed(), 99))
+    plt.imshow(values, origin='lower', extent=grid.extent, cmap='inferno', norm=norm, alpha=0.8,
+               interpolation='nearest', zorder=1)
+    plt.colorbar(label=label)
+
+    if bbox:
+        in_view = grid.query_bbox(*bbox)
+        if rows is not None:
+            in_view = np.intersect1d(in_view, rows, assume_unique=True)
+        plt.xlim(bbox[0], bbox[1])
+        plt.ylim(bbox[2], bbox[3])
+        title += f' ({len(in_view)} listings in view)'
+
+    plt.title(title)
+    plt.xlabel('Longitude')
+    plt.ylabel('Latitude')
 
+    savefig(plots_dest_path + density_map_file(measure, area, bbox))
+    if show:
+        plt.show()
 
 
 if __name__ == "__main__":
-    plot_listing_across_neighbourhood_groups(df, plots_dest_path)
-    plot_price_distrubution_by_neighbourhood_group(df, plots_dest_path)
-    plot_average_availability_by_room_type_across_neighbourhoods(df, plots_dest_path)
-    plot_price_vs_Number_of_reviews_room_type(df, plots_dest_path)
-    plot_trend_number_of_reviews_over_last_review_foreach_neighbourhood(df, plots_dest_path)
-    plot_relationship_between_price_availability_365_across_neighborhoods(df, plots_dest_path)
-    plot_reviews_by_room_type(df, plots_dest_path)
\ No newline at end of file
+    # Plots whose data, code and parameters are unchanged since their last render are skipped
+    # (see render_cache); pass --force to render everything
+    cache = RenderCache(plots_dest_path)
+    force = '--force' in sys.argv[1:]
+    keys = {plot_name: cache.key(globals()[plot_name], plot_data_digest(plot_name)) for plot_name in PLOT_FILES}
+    todo = [plot_name for plot_name in PLOT_FILES if force or not cache.fresh(plot_name, keys[plot_name])]
+    for plot_name in PLOT_FILES:
+        if plot_name not in todo:
+            print(f'{plot_name}: unchanged')
+    if todo:
+        # only the columns of the plots to draw, plus the cube's for the aggregated plots
+        df = load_plot_data(todo)
+        cube = cube_for(load_listings(CUBE_COLUMNS))  # the only pass over the raw listings for them
+    for plot_name in todo:
+        plot = globals()[plot_name]
+        plot(df, plots_dest_path, **({'cube': cube} if 'cube' in inspect.signature(plot).parameters else {}))
+        cache.record(plot_name, keys[plot_name], PLOT_FILES[plot_name])
\ No newline at end of file
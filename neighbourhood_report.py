@@ -0,0 +1,304 @@
+# Small-multiples report of every neighbourhood of the AirBnB listings.
+#
+#   python neighbourhood_report.py                          # plots/neighbourhood_report.pdf
+#   python neighbourhood_report.py --grid                   # plots/neighbourhood_report_grid.png
+#   python neighbourhood_report.py --neighbourhoods Harlem Astoria -o /tmp/
+#
+# One page per neighbourhood with the price box plot per room type, the average
+# availability_365 per room type, the monthly number_of_reviews trend (by last_review) and the
+# price x availability heatmap (the joint bins of airbnb_aggregates).
+# The rows are split by neighbourhood in one sort-based pass: a single lexsort by
+# (neighbourhood, room_type, price) makes every neighbourhood and every (neighbourhood,
+# room_type) segment contiguous with sorted prices, so quartiles and whiskers are index
+# lookups; availability means and the monthly review sums of all neighbourhoods come from one
+# np.bincount each. The figure and all of its artists are created once and only their data is
+# swapped per page (set_data, set_height, set_array, set_text), which is what makes 200+ pages fast.
+# The pages go into one multi-page PDF, or are tiled into one PNG grid with --grid.
+
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+import matplotlib
+import matplotlib.pyplot as plt
+from matplotlib.backends.backend_pdf import PdfPages
+from matplotlib.patches import Rectangle
+
+from airbnb_aggregates import neighbourhood_price_availability_for
+from airbnb_data import ensure_cache, listings_file, load_listings
+from data_schema import as_datetime, codes, encode
+from instrumentation import span, traced
+from matplotlib_practical_task import draw_price_availability
+from render_cache import RenderCache
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+plots_dest_path = script_dir + '/plots/'
+
+REPORT_COLUMNS = ['neighbourhood', 'neighbourhood_group', 'room_type', 'price', 'availability_365',
+                  'number_of_reviews', 'last_review']
+ROOM_COLORS = ['skyblue', 'lightgreen', 'lightcoral']
+PAGE_SIZE = (16, 4)  # inches, one row of four panels
+
+
+# Per-neighbourhood statistics of all neighbourhoods, computed up front in vectorized passes
+class NeighbourhoodFacets:
+    @traced('transform')
+    def __init__(self, df):
+        hood = pd.Categorical(df['neighbourhood'])
+        room = encode('room_type', df['room_type'])
+        hood_codes, room_codes = hood.codes.astype(np.intp), codes(room).astype(np.intp)  # int8 codes would overflow
+        self.room_types = list(room.cat.categories)
+        n_rooms = len(self.room_types)
+
+        valid = (hood_codes >= 0) & (room_codes >= 0)
+        rows = np.flatnonzero(valid)
+        price = df['price'].to_numpy(dtype=np.float64)[rows]
+        hood_codes, room_codes = hood_codes[rows], room_codes[rows]
+
+        # the one sort: neighbourhood, then room type, then price
+        order = np.lexsort((price, room_codes, hood_codes))
+        self.prices = price[order]
+        segment_sizes = np.bincount(hood_codes * n_rooms + room_codes, minlength=len(hood.categories) * n_rooms)
+        self.segment_starts = np.concatenate([[0], np.cumsum(segment_sizes)])
+        self.sizes = segment_sizes.reshape(len(hood.categories), n_rooms)
+
+        present = self.sizes.sum(axis=1) > 0
+        self.labels = [label for label, keep in zip(hood.categories, present) if keep]
+        self._code = {label: code for code, label in enumerate(hood.categories)}
+
+        # borough of every neighbourhood (the first row of its segment decides)
+        groups = np.asarray(df['neighbourhood_group'].astype(object))[rows][order]
+        first = self.segment_starts[::n_rooms][:-1]
+        self.group = {label: groups[first[self._code[label]]] for label in self.labels}
+
+        cell = hood_codes * n_rooms + room_codes
+        availability = df['availability_365'].to_numpy(dtype=np.float64)[rows]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.availability = (np.bincount(cell, weights=availability, minlength=segment_sizes.size)
+                                 / segment_sizes).reshape(self.sizes.shape)
+
+        # monthly sums of number_of_reviews by last_review month, (neighbourhood x month)
+        months = as_datetime(df['last_review']).to_numpy()[rows].astype('datetime64[M]')
+        dated = ~np.isnat(months)
+        if dated.any():
+            first_month, last_month = months[dated].min(), months[dated].max()
+        else:
+            first_month = last_month = np.datetime64('1970-01', 'M')
+        n_months = int((last_month - first_month).astype(np.int64)) + 1
+        month_index = (months[dated] - first_month).astype(np.int64)
+        reviews = df['number_of_reviews'].to_numpy(dtype=np.float64)[rows][dated]
+        self.months = (first_month + np.arange(n_months)).astype('datetime64[D]')
+        self.monthly_reviews = np.bincount(hood_codes[dated] * n_months + month_index, weights=reviews,
+                                           minlength=len(hood.categories) * n_months).reshape(-1, n_months)
+
+        self.price_availability = neighbourhood_price_availability_for(df)
+
+    # Sorted prices of one (neighbourhood, room type) segment
+    def segment(self, label, r):
+        s = self._code[label] * len(self.room_types) + r
+        return self.prices[self.segment_starts[s]:self.segment_starts[s + 1]]
+
+    def listings(self, label):
+        return int(self.sizes[self._code[label]].sum())
+
+    def availability_of(self, label):
+        return self.availability[self._code[label]]
+
+    def reviews_of(self, label):
+        return self.monthly_reviews[self._code[label]]
+
+    # Share of the neighbourhood's listings (%) per (price bin, availability bin)
+    def price_availability_of(self, label):
+        counts = self.price_availability[label]
+        return 100 * counts / counts.sum()
+
+
+# Quartiles (linear, as np.percentile), whiskers and fliers of already sorted values
+def _box_stats(values, whis=1.5):
+    n = len(values)
+
+    def quantile(q):
+        position = q * (n - 1)
+        lower = int(np.floor(position))
+        upper = min(lower + 1, n - 1)
+        return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+    q1, med, q3 = quantile(0.25), quantile(0.5), quantile(0.75)
+    iqr = q3 - q1
+    lo = np.searchsorted(values, q1 - whis * iqr, side='left')
+    hi = np.searchsorted(values, q3 + whis * iqr, side='right')
+    whislo, whishi = (values[lo], values[hi - 1]) if hi > lo else (q1, q3)
+    fliers = np.concatenate([values[:lo], values[hi:]])
+    return q1, med, q3, whislo, whishi, fliers
+
+
+# The figure of one page, created once; update() swaps in the data of one neighbourhood
+class FacetTemplate:
+    def __init__(self, facets, figsize=PAGE_SIZE):
+        self.facets = facets
+        self.fig, (self.ax_price, self.ax_avail, self.ax_trend, self.ax_joint) = plt.subplots(1, 4, figsize=figsize)
+        self.title = self.fig.suptitle('')
+        positions = np.arange(len(facets.room_types))
+        nan = [np.nan]
+
+        # price box plot: the box as a rectangle, median, whiskers with caps as one line each and
+        # the fliers as markers
+        self.boxes = []
+        for r, color in zip(positions, ROOM_COLORS):
+            self.boxes.append({
+                'box': self.ax_price.add_patch(Rectangle((r - 0.3, 0), 0.6, 0, facecolor=color, edgecolor='black')),
+                'median': self.ax_price.plot(nan, nan, color='darkorange', linewidth=2)[0],
+                'whiskers': self.ax_price.plot(nan, nan, color='black', linewidth=1)[0],
+                'fliers': self.ax_price.plot(nan, nan, linestyle='none', marker='o', markersize=3,
+                                             markerfacecolor=color, markeredgecolor='grey')[0],
+            })
+        self.ax_price.set_xticks(positions, facets.room_types, fontsize=8)
+        self.ax_price.set_xlim(-0.6, len(positions) - 0.4)
+        self.ax_price.set_title('Price Distribution by Room Type', fontsize=10)
+        self.ax_price.set_ylabel('Price')
+
+        self.bars = self.ax_avail.bar(positions, np.zeros(len(positions)), color=ROOM_COLORS, edgecolor='black')
+        self.ax_avail.set_xticks(positions, facets.room_types, fontsize=8)
+        self.ax_avail.set_ylim(0, 365)  # same scale on every page
+        self.ax_avail.set_title('Average Availability by Room Type', fontsize=10)
+        self.ax_avail.set_ylabel('Average Availability (days)')
+
+        self.trend, = self.ax_trend.plot(facets.months, np.zeros(len(facets.months)), color='steelblue')
+        self.ax_trend.set_title('Number of Reviews by Last Review Month', fontsize=10)
+        self.ax_trend.set_ylabel('Number of Reviews')
+        self.ax_trend.tick_params(axis='x', labelsize=8, labelrotation=30)
+
+        # one mesh for all pages, its colors are replaced with set_array
+        self.mesh = draw_price_availability(self.ax_joint, np.zeros(next(iter(facets.price_availability.values())).shape))
+        self.colorbar = self.fig.colorbar(self.mesh, ax=self.ax_joint, label='Share of Listings (%)')
+        self.ax_joint.set_title('Price vs Availability', fontsize=10)
+        self.ax_joint.set_xlabel('Availability (days)', fontsize=8)
+        self.ax_joint.set_ylabel('Price')
+        # fixed margins instead of tight_layout: a figure with a layout engine is drawn twice
+        # per savefig, and the margins do not depend on the neighbourhood anyway
+        self.fig.subplots_adjust(left=0.05, right=0.98, bottom=0.2, top=0.82, wspace=0.3)
+
+    def update(self, label):
+        facets = self.facets
+        self.title.set_text(f'{label} ({facets.group[label]}), {facets.listings(label)} listings')
+
+        top = 0
+        for r, artists in enumerate(self.boxes):
+            values = facets.segment(label, r)
+            artists['box'].set_visible(len(values) > 0)
+            if not len(values):
+                for name in ('median', 'whiskers', 'fliers'):
+                    artists[name].set_data([], [])
+                continue
+            q1, med, q3, whislo, whishi, fliers = _box_stats(values)
+            artists['box'].set_y(q1)
+            artists['box'].set_height(q3 - q1)
+            artists['median'].set_data([r - 0.3, r + 0.3], [med, med])
+            artists['whiskers'].set_data([r, r, np.nan, r, r, np.nan, r - 0.15, r + 0.15, np.nan, r - 0.15, r + 0.15],
+                                         [whislo, q1, np.nan, q3, whishi, np.nan, whislo, whislo, np.nan, whishi, whishi])
+            artists['fliers'].set_data(np.full(len(fliers), r), fliers)
+            top = max(top, values[-1])
+        self.ax_price.set_ylim(0, top * 1.05 if top else 1)
+
+        for bar, value in zip(self.bars, facets.availability_of(label)):
+            bar.set_height(0 if np.isnan(value) else value)
+
+        reviews = facets.reviews_of(label)
+        self.trend.set_ydata(reviews)
+        self.ax_trend.set_ylim(0, reviews.max() * 1.05 if reviews.any() else 1)
+
+        share = facets.price_availability_of(label)
+        self.mesh.set_array(np.ma.masked_equal(share, 0).ravel())
+        self.mesh.set_clim(0, share.max())
+
+    def close(self):
+        plt.close(self.fig)
+
+
+# All pages into one multi-page PDF
+@traced('render')
+def render_pdf(facets, path, labels=None):
+    template = FacetTemplate(facets)
+    try:
+        with PdfPages(path) as pdf:
+            for label in labels or facets.labels:
+                template.update(label)
+                pdf.savefig(template.fig)
+    finally:
+        template.close()
+    return path
+
+
+# All pages tiled into one PNG: every page is drawn at a small dpi into the same canvas
+# and its pixels are copied into the grid
+@traced('render')
+def render_grid(facets, path, labels=None, columns=8, dpi=40):
+    labels = labels or facets.labels
+    template = FacetTemplate(facets)
+    try:
+        template.fig.set_dpi(dpi)
+        canvas = template.fig.canvas
+        tiles = None
+        for i, label in enumerate(labels):
+            template.update(label)
+            canvas.draw()
+            page = np.asarray(canvas.buffer_rgba())
+            if tiles is None:
+                height, width = page.shape[:2]
+                rows = -(-len(labels) // columns)
+                tiles = np.full((rows * height, columns * width, 4), 255, dtype=np.uint8)
+            row, column = divmod(i, columns)
+            tiles[row * height:(row + 1) * height, column * width:(column + 1) * width] = page
+    finally:
+        template.close()
+    with span('savefig', 'write'):
+        plt.imsave(path, tiles)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render the small-multiples report of all neighbourhoods.')
+    parser.add_argument('-o', '--dest', default=None, help='output directory (default: plots/)')
+    parser.add_argument('--grid', action='store_true', help='one PNG grid instead of a multi-page PDF')
+    parser.add_argument('--columns', type=int, default=8, help='pages per row of the PNG grid')
+    parser.add_argument('--neighbourhoods', nargs='+', default=None, help='only these neighbourhoods')
+    parser.add_argument('--csv', default=None, help='listings CSV (default: AirBnB_NY/AB_NYC_2019.csv)')
+    parser.add_argument('--force', action='store_true', help='render even if data and code are unchanged')
+    args = parser.parse_args(argv)
+
+    matplotlib.use('Agg')
+    dest = os.path.join(args.dest, '') if args.dest else plots_dest_path
+    os.makedirs(dest, exist_ok=True)
+    file_name = 'neighbourhood_report_grid.png' if args.grid else 'neighbourhood_report.pdf'
+    params = {'grid': args.grid, 'neighbourhoods': args.neighbourhoods, 'columns': args.columns if args.grid else None}
+
+    # Skipped like the other reports when its columns, code and parameters are unchanged
+    csv_path = args.csv or listings_file
+    manifest = ensure_cache(csv_path)
+    cache = RenderCache(dest)
+    # keyed on main, whose code digest reaches NeighbourhoodFacets, FacetTemplate and both renderers
+    key = cache.key(main, {col: manifest['columns'][col]['sha256'] for col in REPORT_COLUMNS}, params)
+    if not args.force and cache.fresh(file_name, key):
+        print(f'{file_name}: unchanged')
+        return 0
+
+    facets = NeighbourhoodFacets(load_listings(REPORT_COLUMNS, csv_path=csv_path))
+    labels = args.neighbourhoods
+    if labels:
+        unknown = [label for label in labels if label not in facets.group]
+        if unknown:
+            raise SystemExit(f"Unknown neighbourhood(s): {', '.join(unknown)}")
+    if args.grid:
+        render_grid(facets, dest + file_name, labels, columns=args.columns)
+    else:
+        render_pdf(facets, dest + file_name, labels)
+    cache.record(file_name, key, [file_name])
+    print(f'{len(labels or facets.labels)} neighbourhoods written to {dest + file_name}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
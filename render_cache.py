@@ -0,0 +1,161 @@
+# Content-addressed render cache for the report scripts.
+#
+# Every rendered plot is recorded in a manifest next to its output files (.render_cache.json
+# in plots/ or bokeh_plots/) under a key that hashes
+#   - the input data slice the plot reads (column digests),
+#   - the parameters the plot is called with,
+#   - the code version: the plot function's source plus every module-level helper and
+#     constant of the same module it references, the full source of the repo modules it
+#     calls into (aggregates, schema, ...) and of the repo modules those import in turn,
+#     and the numpy/pandas/matplotlib/bokeh versions.
+# A plot whose key matches the manifest and whose output files are untouched is not
+# rendered again, so editing one plot function re-renders one file.
+
+import hashlib
+import inspect
+import json
+import os
+import types
+from importlib import metadata
+
+import numpy as np
+import pandas as pd
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+MANIFEST_NAME = '.render_cache.json'
+LIBRARIES = ('numpy', 'pandas', 'matplotlib', 'bokeh')
+
+
+def digest(*parts):
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+# Digest of one column's values; categoricals hash their codes and labels
+def array_digest(values):
+    sha = hashlib.sha256()
+    if isinstance(getattr(values, 'dtype', None), pd.CategoricalDtype):
+        sha.update(json.dumps([str(label) for label in values.cat.categories]).encode())
+        values = values.cat.codes
+    array = np.asarray(values)
+    if array.dtype == object:
+        sha.update(json.dumps(array.tolist(), default=str).encode())
+    else:
+        sha.update(str(array.dtype).encode())
+        sha.update(np.ascontiguousarray(array).tobytes())
+    return sha.hexdigest()
+
+
+# Digest of the given columns of a DataFrame (the data slice one plot reads)
+def frame_digest(df, columns):
+    return digest({column: array_digest(df[column]) for column in columns})
+
+
+def _library_versions():
+    versions = {}
+    for name in LIBRARIES:
+        try:
+            versions[name] = metadata.version(name)
+        except metadata.PackageNotFoundError:
+            versions[name] = None
+    return versions
+
+
+def _is_repo_module(module):
+    path = getattr(module, '__file__', None)
+    return bool(path) and os.path.isfile(path) and os.path.dirname(os.path.abspath(path)) == script_dir
+
+
+def _code_objects(code):
+    yield code
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            yield from _code_objects(const)
+
+
+# Source digest of a plot function and everything of the repo it depends on
+def code_digest(func):
+    func = inspect.unwrap(func)  # instrumentation.traced wrappers
+    home = inspect.getmodule(func)
+    parts, seen, modules = [], set(), set()
+
+    # Hash a whole repo module, then the repo modules it imports (as modules or through the
+    # functions and classes it imports from them)
+    def visit_module(module):
+        if module is home or module.__name__ in modules or not _is_repo_module(module):
+            return
+        modules.add(module.__name__)
+        with open(module.__file__, 'rb') as f:
+            parts.append([module.__name__, hashlib.sha256(f.read()).hexdigest()])
+        for value in list(vars(module).values()):
+            if inspect.ismodule(value):
+                visit_module(value)
+            elif inspect.isfunction(value) or inspect.isclass(value):
+                dependency = inspect.getmodule(inspect.unwrap(value) if inspect.isfunction(value) else value)
+                if dependency is not None:
+                    visit_module(dependency)
+
+    def visit(obj):
+        if id(obj) in seen:
+            return
+        seen.add(id(obj))
+        module = inspect.getmodule(obj)
+        if module is not home:
+            if module is not None:
+                visit_module(module)
+            return
+        parts.append(inspect.getsource(obj))
+        functions = [obj] if inspect.isfunction(obj) else [m for m in vars(obj).values() if inspect.isfunction(m)]
+        for code in (c for function in functions for c in _code_objects(function.__code__)):
+            for name in code.co_names:
+                value = vars(home).get(name)
+                if inspect.isfunction(value) or inspect.isclass(value):
+                    visit(inspect.unwrap(value))
+                elif isinstance(value, (bool, int, float, str, tuple, list, dict)):
+                    parts.append([name, repr(value)])
+
+    visit(func)
+    return digest(parts, _library_versions())
+
+
+class RenderCache:
+    def __init__(self, dest):
+        self.dest = os.path.join(dest, '')
+        self.path = self.dest + MANIFEST_NAME
+        try:
+            with open(self.path) as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def key(self, func, data, params=None):
+        return digest(func.__name__, data, params or {}, code_digest(func))
+
+    # True if name was rendered with this key and none of its outputs changed since
+    def fresh(self, name, key):
+        entry = self.entries.get(name)
+        if not entry or entry['key'] != key:
+            return False
+        for file_name, recorded in entry['files'].items():
+            try:
+                stat = os.stat(self.dest + file_name)
+            except OSError:
+                return False
+            if [stat.st_size, stat.st_mtime_ns] != recorded:
+                return False
+        return True
+
+    def record(self, name, key, file_names):
+        files = {}
+        for file_name in file_names:
+            stat = os.stat(self.dest + file_name)
+            files[file_name] = [stat.st_size, stat.st_mtime_ns]
+        self.entries[name] = {'key': key, 'files': files}
+        self.save()
+
+    def save(self):
+        os.makedirs(self.dest, exist_ok=True)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)  # an interrupted run never leaves a half-written manifest
@@ -0,0 +1,167 @@
+# Headless batch renderer for the matplotlib reports.
+#
+#   python render_reports.py                      # render all plots
+#   python render_reports.py listings heatmap -j 2
+#   python render_reports.py --list
+#
+# Plots are rendered with the Agg backend (no plt.show) in a process pool. Workers do not
+# receive the DataFrame through pickling: every worker maps the columnar .npy cache built by
+# airbnb_data read-only, so all processes share the same pages of the OS page cache, and only
+# the columns the selected plots read (airbnb_data.PLOT_COLUMNS). The aggregate cube is built
+# once in the parent from its own columns and handed to each worker (it is tiny).
+#
+# Plots whose input columns, code and parameters did not change since they were last
+# rendered into the output directory are skipped (see render_cache); --force renders all.
+#
+#   python render_reports.py --trace trace.json --summary      # spans of parent and workers
+#   python render_reports.py price_vs_reviews --profile price_vs_reviews --force
+
+import argparse
+import inspect
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import matplotlib
+matplotlib.use('Agg')  # must happen before pyplot is imported (also by forked workers)
+import matplotlib.pyplot as plt
+
+import airbnb_data
+import instrumentation
+import matplotlib_practical_task as tasks
+from airbnb_aggregates import CUBE_COLUMNS, cube_for
+from render_cache import RenderCache
+
+
+# Short CLI names of the report plots, in the order of the original __main__ block
+PLOTS = {
+    'listings': 'plot_listing_across_neighbourhood_groups',
+    'price_distribution': 'plot_price_distrubution_by_neighbourhood_group',
+    'availability': 'plot_average_availability_by_room_type_across_neighbourhoods',
+    'price_vs_reviews': 'plot_price_vs_Number_of_reviews_room_type',
+    'reviews_trend': 'plot_trend_number_of_reviews_over_last_review_foreach_neighbourhood',
+    'heatmap': 'plot_relationship_between_price_availability_365_across_neighborhoods',
+    'reviews_by_room_type': 'plot_reviews_by_room_type',
+    'density_map': 'plot_listing_density_map',
+}
+
+
+_worker_df = None
+_worker_cube = None
+_in_worker = False
+
+
+def _init_worker(csv_path, cube, plot_names, trace_settings=None):
+    global _worker_df, _worker_cube, _in_worker
+    if trace_settings is not None:  # pool worker: spans go back to the parent with each result
+        _in_worker = True
+        instrumentation.configure(**trace_settings, at_exit=False)
+        instrumentation.reset()  # forked workers start with a copy of the parent's spans
+    _worker_df = airbnb_data.load_plot_data(plot_names, csv_path=csv_path, mmap=True)
+    _worker_cube = cube
+
+
+# Render one plot; returns (name, seconds, spans recorded in a worker process)
+def _render(name, plots_dest_path):
+    func = getattr(tasks, PLOTS[name])
+    kwargs = {'cube': _worker_cube} if 'cube' in inspect.signature(func).parameters else {}
+    start = time.perf_counter()
+    func(_worker_df, plots_dest_path, show=False, **kwargs)
+    plt.close('all')
+    seconds = time.perf_counter() - start
+    spans = []
+    if _in_worker:
+        spans = instrumentation.spans()
+        instrumentation.reset()
+    return name, seconds, spans
+
+
+def resolve_plot_names(names):
+    if not names:
+        return list(PLOTS)
+    by_function = {func: name for name, func in PLOTS.items()}
+    resolved = []
+    for name in names:
+        name = by_function.get(name, name)  # accept full function names too
+        if name not in PLOTS:
+            raise SystemExit(f"Unknown plot '{name}'. Available: {', '.join(PLOTS)}")
+        resolved.append(name)
+    return resolved
+
+
+# Render the selected plots and return {name: seconds}, with None for plots the render
+# cache found unchanged
+def render_reports(names=None, plots_dest_path=None, csv_path=None, jobs=None, force=False):
+    names = resolve_plot_names(names)
+    plots_dest_path = plots_dest_path or tasks.plots_dest_path
+    csv_path = csv_path or airbnb_data.listings_file
+    os.makedirs(plots_dest_path, exist_ok=True)
+
+    cache = RenderCache(plots_dest_path)
+    keys = {name: cache.key(getattr(tasks, PLOTS[name]), airbnb_data.plot_data_digest(PLOTS[name], csv_path))
+            for name in names}
+    timings = {name: None for name in names}
+    todo = [name for name in names if force or not cache.fresh(PLOTS[name], keys[name])]
+    if not todo:
+        return timings
+
+    def done(name, seconds, spans):
+        timings[name] = seconds
+        instrumentation.add_spans(spans)
+        cache.record(PLOTS[name], keys[name], airbnb_data.PLOT_FILES[PLOTS[name]])
+
+    # Parse at most once and aggregate once, before the workers start
+    cube = cube_for(airbnb_data.load_listings(CUBE_COLUMNS, csv_path=csv_path, mmap=True))
+    plot_names = [PLOTS[name] for name in todo]
+
+    jobs = min(jobs or os.cpu_count() or 1, len(todo))
+    if jobs == 1:
+        _init_worker(csv_path, cube, plot_names)
+        for name in todo:
+            done(*_render(name, plots_dest_path))
+        return timings
+
+    initargs = (csv_path, cube, plot_names, instrumentation.settings())
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=initargs) as pool:
+        futures = [pool.submit(_render, name, plots_dest_path) for name in todo]
+        for future in as_completed(futures):
+            done(*future.result())
+    return timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render the AirBnB matplotlib reports headlessly.')
+    parser.add_argument('plots', nargs='*', help='plots to render (default: all)')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='worker processes (default: CPU count)')
+    parser.add_argument('-o', '--dest', default=None, help='output directory (default: plots/)')
+    parser.add_argument('--csv', default=None, help='listings CSV (default: AirBnB_NY/AB_NYC_2019.csv)')
+    parser.add_argument('--list', action='store_true', help='list the available plots and exit')
+    parser.add_argument('--force', action='store_true', help='render even plots the render cache finds unchanged')
+    parser.add_argument('--trace', default=None, help='write the instrumentation spans as Chrome trace JSON')
+    parser.add_argument('--summary', action='store_true', help='print a per-span timing summary')
+    parser.add_argument('--profile', default=None, metavar='PLOT', help='run cProfile around one plot')
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for name, func in PLOTS.items():
+            print(f'{name:22} {func}')
+        return 0
+
+    if args.trace or args.summary or args.profile:
+        profile = args.profile and PLOTS.get(args.profile, args.profile)  # short or function name
+        instrumentation.configure(trace=args.trace, summary=args.summary, profile=profile)
+
+    dest = args.dest and os.path.join(args.dest, '')  # plot functions concatenate file names
+    start = time.perf_counter()
+    timings = render_reports(args.plots, plots_dest_path=dest, csv_path=args.csv, jobs=args.jobs, force=args.force)
+    total = time.perf_counter() - start
+
+    for name, seconds in timings.items():
+        print(f'{name:22} {seconds:8.3f} s' if seconds is not None else f'{name:22}  unchanged')
+    print(f"{'wall time':22} {total:8.3f} s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+
+
+# Bounding box of New York City and of the AirBnB_NY/New_York_City_.png basemap:
+# [lon_min, lon_max, lat_min, lat_max], as expected by imshow(extent=...)
+NYC_EXTENT = [-74.258, -73.7, 40.49, 40.92]
+
+# Cells of the grid, (latitude rows, longitude columns): cells of about 190 x 170 m in NYC
+GRID_SHAPE = (256, 256)
+
+
+# Uniform grid index over point coordinates. Every point is assigned to one cell of a fixed
+# grid over `extent`; the point positions are stored sorted by cell (compressed rows: the
+# points of cell c are rows[starts[c]:starts[c + 1]]), and per-cell counts and value sums
+# are kept as rasters. So
+#   - a density or mean raster costs O(cells), whatever the number of points,
+#   - a bounding box query reads one contiguous slice per grid row plus the exact test of
+#     the candidates, instead of comparing every point,
+#   - the points of one label of a group column (e.g. a neighbourhood) are one slice of a
+#     second ordering by (label, cell), and its raster is built from that slice only.
+# Points outside the extent (or without coordinates) are counted in `outside` only.
+class GridIndex:
+    def __init__(self, lon, lat, extent=None, shape=GRID_SHAPE, values=None, groups=None):
+        self.extent = list(extent or NYC_EXTENT)
+        self.shape = tuple(shape)
+        ny, nx = self.shape
+        x0, x1, y0, y1 = self.extent
+        lon = np.asarray(lon, dtype=np.float64)
+        lat = np.asarray(lat, dtype=np.float64)
+        self.n_points = len(lon)
+
+        with np.errstate(invalid='ignore'):
+            ix = np.floor((lon - x0) * (nx / (x1 - x0)))
+            iy = np.floor((lat - y0) * (ny / (y1 - y0)))
+            # points exactly on the upper border belong to the last cell
+            ix[lon == x1], iy[lat == y1] = nx - 1, ny - 1
+            inside = (ix >= 0) & (ix < nx) & (iy >= 0) & (iy < ny)
+        cell = np.full(self.n_points, -1, dtype=np.intp)
+        cell[inside] = iy[inside].astype(np.intp) * nx + ix[inside].astype(np.intp)
+        self.cell = cell
+        self.outside = int(self.n_points - inside.sum())
+
+        self.rows = np.flatnonzero(inside)[np.argsort(cell[inside], kind='stable')]
+        self.count = np.bincount(cell[inside], minlength=ny * nx).reshape(ny, nx)
+        self.starts = np.concatenate([[0], np.cumsum(self.count.reshape(-1))])
+        self.lon, self.lat = lon[self.rows], lat[self.rows]  # coordinates in cell order
+
+        self.sums = {}
+        for name, column in (values or {}).items():
+            weights = np.asarray(column, dtype=np.float64)[inside]
+            self.sums[name] = np.bincount(cell[inside], weights=weights, minlength=ny * nx).reshape(ny, nx)
+
+        self.groups = {}
+        for name, column in (groups or {}).items():
+            labels = pd.Categorical(column)  # keeps the categories of an encoded column
+            codes, categories = np.asarray(labels.codes), list(labels.categories)
+            keep = inside & (codes >= 0)
+            # one stable sort by (label, cell): each label's points are contiguous and in cell order
+            order = np.flatnonzero(keep)[np.lexsort((cell[keep], codes[keep]))]
+            group_starts = np.concatenate([[0], np.cumsum(np.bincount(codes[keep], minlength=len(categories)))])
+            self.groups[name] = (categories, order, group_starts)
+
+    # Count raster ('count'), or the per-cell sum or mean of one of the indexed values;
+    # rows are latitude (south first), columns longitude, as imshow(origin='lower') draws them
+    def raster(self, measure='count', stat='mean'):
+        if measure == 'count':
+            return self.count
+        if stat == 'sum':
+            return self.sums[measure]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.sums[measure] / self.count
+
+    # Positions of the points inside [lon0, lon1] x [lat0, lat1], in cell order
+    def query_bbox(self, lon0, lon1, lat0, lat1):
+        ny, nx = self.shape
+        x0, x1, y0, y1 = self.extent
+        ix0 = max(int(np.floor((lon0 - x0) * (nx / (x1 - x0)))), 0)
+        ix1 = min(int(np.floor((lon1 - x0) * (nx / (x1 - x0)))), nx - 1)
+        iy0 = max(int(np.floor((lat0 - y0) * (ny / (y1 - y0)))), 0)
+        iy1 = min(int(np.floor((lat1 - y0) * (ny / (y1 - y0)))), ny - 1)
+        if ix0 > ix1 or iy0 > iy1:
+            return np.zeros(0, dtype=np.intp)
+
+        # cells of one grid row are adjacent in the ordering, so each grid row is one slice;
+        # the slices are concatenated without a Python loop
+        first = np.arange(iy0, iy1 + 1) * nx
+        begin, end = self.starts[first + ix0], self.starts[first + ix1 + 1]
+        lengths = end - begin
+        candidates = np.arange(lengths.sum()) + np.repeat(begin - (np.cumsum(lengths) - lengths), lengths)
+        lon, lat = self.lon[candidates], self.lat[candidates]
+        hit = (lon >= lon0) & (lon <= lon1) & (lat >= lat0) & (lat <= lat1)
+        return self.rows[candidates[hit]]
+
+    # Positions of the points of one label of a group column, in cell order
+    def group_rows(self, name, label):
+        categories, order, group_starts = self.groups[name]
+        if label not in categories:
+            return np.zeros(0, dtype=np.intp)
+        code = categories.index(label)
+        return order[group_starts[code]:group_starts[code + 1]]
+
+    # Count raster of the points of one label of a group column
+    def group_raster(self, name, label):
+        rows = self.group_rows(name, label)
+        return np.bincount(self.cell[rows], minlength=self.shape[0] * self.shape[1]).reshape(self.shape)
@@ -0,0 +1,112 @@
+# Synthetic AirBnB- and Titanic-schema data of any size, for benchmark_reports.py.
+#
+# The listings follow the published marginals of AB_NYC_2019.csv (borough and room type
+# shares, log-normal prices per room type and borough, ~20% listings without reviews and
+# therefore without last_review, ~36% with zero availability, ...). The passengers are
+# resampled row by row from Titanic/Titanic-Dataset.csv with a little Fare/Age jitter, so
+# every joint distribution the charts aggregate (class x sex x age x survival) is kept.
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from spatial_index import NYC_EXTENT
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+titanic_file = script_dir + '/Titanic/Titanic-Dataset.csv'
+
+# Share of listings, borough centre (lat, lon) and price factor of every neighbourhood_group
+AIRBNB_GROUPS = {
+    'Manhattan': (0.443, 40.765, -73.975, 1.25),
+    'Brooklyn': (0.411, 40.685, -73.950, 0.90),
+    'Queens': (0.116, 40.730, -73.870, 0.75),
+    'Bronx': (0.022, 40.850, -73.880, 0.70),
+    'Staten Island': (0.008, 40.610, -74.100, 0.75),
+}
+# Share and median price of every room_type
+AIRBNB_ROOM_TYPES = {
+    'Entire home/apt': (0.520, 160.0),
+    'Private room': (0.456, 70.0),
+    'Shared room': (0.024, 45.0),
+}
+NEIGHBOURHOODS = {
+    'Manhattan': ['Harlem', 'Upper West Side', "Hell's Kitchen", 'East Village', 'Upper East Side', 'Midtown'],
+    'Brooklyn': ['Williamsburg', 'Bedford-Stuyvesant', 'Bushwick', 'Crown Heights', 'Greenpoint'],
+    'Queens': ['Astoria', 'Long Island City', 'Flushing', 'Ridgewood'],
+    'Bronx': ['Mott Haven', 'Concourse', 'Fordham'],
+    'Staten Island': ['St. George', 'Tompkinsville'],
+}
+FIRST_REVIEW, LAST_REVIEW = np.datetime64('2011-03-28'), np.datetime64('2019-07-08')
+
+
+def _choice(rng, table, n):
+    labels = list(table)
+    shares = np.array([table[label][0] for label in labels])
+    return np.array(labels, dtype=object)[rng.choice(len(labels), n, p=shares / shares.sum())]
+
+
+# n listings with every column of AB_NYC_2019.csv
+def synthetic_listings(n, seed=0):
+    rng = np.random.default_rng(seed)
+    group = _choice(rng, AIRBNB_GROUPS, n)
+    room_type = _choice(rng, AIRBNB_ROOM_TYPES, n)
+
+    group_info = pd.DataFrame(AIRBNB_GROUPS, index=['share', 'lat', 'lon', 'price_factor']).T
+    lat = group_info['lat'].reindex(group).to_numpy() + rng.normal(0, 0.03, n)
+    lon = group_info['lon'].reindex(group).to_numpy() + rng.normal(0, 0.03, n)
+
+    neighbourhood = np.empty(n, dtype=object)
+    for name, hoods in NEIGHBOURHOODS.items():
+        rows = np.flatnonzero(group == name)
+        neighbourhood[rows] = np.array(hoods, dtype=object)[rng.integers(0, len(hoods), len(rows))]
+
+    median_price = pd.Series({k: v[1] for k, v in AIRBNB_ROOM_TYPES.items()}).reindex(room_type).to_numpy()
+    price = median_price * group_info['price_factor'].reindex(group).to_numpy() * rng.lognormal(0, 0.6, n)
+    price = np.where(rng.random(n) < 0.0002, 0, np.minimum(price, 10000)).astype(np.int64)
+
+    reviews = np.minimum(rng.geometric(1 / 29, n), 629)
+    reviews[rng.random(n) < 0.206] = 0
+    has_review = reviews > 0
+    days_before_last = np.minimum(rng.exponential(300, n).astype(np.int64), int((LAST_REVIEW - FIRST_REVIEW).astype(int)))
+    last_review = pd.Series(LAST_REVIEW - days_before_last.astype('timedelta64[D]')).dt.strftime('%Y-%m-%d')
+    reviews_per_month = np.clip(rng.lognormal(np.log(0.9), 1.0, n), 0.01, 58.5).round(2)
+
+    availability = rng.integers(1, 366, n)
+    availability[rng.random(n) < 0.36] = 0
+
+    return pd.DataFrame({
+        'id': np.arange(2539, 2539 + n),
+        'name': np.array(['Cozy room', 'Sunny loft', 'Spacious apartment', 'Quiet studio'], dtype=object)[rng.integers(0, 4, n)],
+        'host_id': rng.integers(2438, 274321313, n),
+        'host_name': np.array(['John', 'Maria', 'Sonder', 'Michael'], dtype=object)[rng.integers(0, 4, n)],
+        'neighbourhood_group': group,
+        'neighbourhood': neighbourhood,
+        'latitude': np.clip(lat, NYC_EXTENT[2], NYC_EXTENT[3]).round(5),
+        'longitude': np.clip(lon, NYC_EXTENT[0], NYC_EXTENT[1]).round(5),
+        'room_type': room_type,
+        'price': price,
+        'minimum_nights': rng.choice([1, 2, 3, 4, 5, 7, 14, 30], n, p=[.26, .24, .16, .07, .06, .04, .03, .14]),
+        'number_of_reviews': reviews,
+        'last_review': last_review.where(has_review),
+        'reviews_per_month': np.where(has_review, reviews_per_month, np.nan),
+        'calculated_host_listings_count': np.minimum(rng.zipf(2.0, n), 327),
+        'availability_365': availability,
+    })
+
+
+# n passengers resampled from the Titanic dataset (all columns of Titanic-Dataset.csv)
+def synthetic_passengers(n, seed=0):
+    rng = np.random.default_rng(seed)
+    titanic = pd.read_csv(titanic_file)
+    df = titanic.iloc[rng.integers(0, len(titanic), n)].reset_index(drop=True)
+    df['PassengerId'] = np.arange(1, n + 1)
+    df['Fare'] = (df['Fare'] * rng.lognormal(0, 0.05, n)).round(4)
+    df['Age'] = (df['Age'] + rng.uniform(-0.5, 0.5, n)).clip(lower=0.42).round(1)
+    return df
+
+
+def write_csv(df, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    df.to_csv(path, index=False)
+    return path
@@ -0,0 +1,48 @@
+import os
+
+import numpy as np
+import pytest
+
+import airbnb_data
+from synthetic_data import synthetic_listings, write_csv
+
+
+@pytest.fixture
+def cache_root(tmp_path, monkeypatch):
+    monkeypatch.setattr(airbnb_data, 'cache_path', str(tmp_path / 'cache') + '/')
+    airbnb_data.forget_frames()
+    yield tmp_path
+    airbnb_data.forget_frames()
+
+
+def _write_listings(path, n, seed):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_csv(synthetic_listings(n, seed=seed), path)
+    return path
+
+
+# Two CSVs with the same file name get their own cache directories
+def test_same_file_name_does_not_share_cache(cache_root):
+    first = _write_listings(str(cache_root / 'a' / 'AB_NYC_2019.csv'), 200, seed=1)
+    second = _write_listings(str(cache_root / 'b' / 'AB_NYC_2019.csv'), 300, seed=2)
+
+    assert airbnb_data._cache_dir_for(first) != airbnb_data._cache_dir_for(second)
+    assert airbnb_data.ensure_cache(first)['rows'] == 200
+    assert airbnb_data.ensure_cache(second)['rows'] == 300
+    # neither load rebuilt the other's cache
+    assert airbnb_data.ensure_cache(first)['sha256'] == airbnb_data.file_sha256(first)
+
+
+# A frame memory-mapped from the cache stays readable when the cache of its CSV is rebuilt
+def test_rebuild_keeps_mapped_frame_readable(cache_root):
+    path = _write_listings(str(cache_root / 'AB_NYC_2019.csv'), 500, seed=1)
+    mapped = airbnb_data.load_listings(['price', 'neighbourhood_group'], csv_path=path, mmap=True)
+    expected = mapped['price'].to_numpy().copy()
+
+    _write_listings(path, 100, seed=2)  # changed content: the column files are rewritten
+    airbnb_data.forget_frames()
+    rebuilt = airbnb_data.load_listings(['price'], csv_path=path, mmap=True)
+
+    assert len(rebuilt) == 100
+    np.testing.assert_array_equal(mapped['price'].to_numpy(), expected)
+    assert mapped['neighbourhood_group'].value_counts().sum() == 500
@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+
+from airbnb_incremental import refresh, verify
+from synthetic_data import synthetic_listings, write_csv
+
+
+# Next day's snapshot: removed, changed (including the price maximum, a borough move and
+# new reviews) and added listings
+def _next_snapshot(df, rng, removed=500, changed=351, added=20):
+    df = df.drop(index=rng.choice(df.index, removed, replace=False))
+    rows = rng.choice(df.index, changed, replace=False)
+    df.loc[rows[:100], 'price'] = rng.integers(10, 500, 100)
+    df.loc[df['price'].idxmax(), 'price'] = 1
+    df.loc[rows[100:200], 'availability_365'] = rng.integers(0, 366, 100)
+    df.loc[rows[200:250], 'neighbourhood_group'] = 'Staten Island'
+    df.loc[rows[250:], 'number_of_reviews'] += 1
+    df.loc[rows[250:], 'last_review'] = '2019-07-09'
+
+    new = synthetic_listings(added, seed=int(rng.integers(1 << 30)))
+    new['id'] = df['id'].max() + 1 + np.arange(added)
+    return pd.concat([df, new], ignore_index=True)
+
+
+def test_refresh_matches_full_build(tmp_path):
+    rng = np.random.default_rng(7)
+    state_dir = str(tmp_path / 'state') + '/'
+    snapshot = synthetic_listings(5000, seed=1)
+
+    for day in range(3):
+        path = str(tmp_path / f'listings_{day}.csv')
+        write_csv(snapshot, path)
+        cube, daily, new, churn = refresh(path, state_dir)
+        assert verify(cube, daily, new) == []
+        if day:
+            assert churn == {'added': 20, 'removed': 500, 'changed': churn['changed']}
+            assert 300 <= churn['changed'] <= 351
+        snapshot = _next_snapshot(snapshot, rng)
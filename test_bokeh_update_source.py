@@ -0,0 +1,60 @@
+import math
+import random
+
+import numpy as np
+from bokeh.models import ColumnDataSource
+
+from Bokeh_practical_tasks import update_source
+
+
+def _value(rng, kind):
+    if kind == 'float':
+        return math.nan if rng.random() < 0.2 else rng.choice([0.0, 1.5, 2.25, 100.0])
+    if kind == 'int':
+        return rng.randint(0, 3)
+    if kind == 'str':
+        return rng.choice(['1', '2', '3', 'female', 'male'])
+    return (rng.choice(['1', '2', '3']), rng.choice(['female', 'male']))  # nested factor
+
+
+def _column(rng, kind, n, as_array):
+    values = [_value(rng, kind) for _ in range(n)]
+    return np.array(values) if as_array and kind in ('float', 'int') else values
+
+
+def _same(a, b):
+    return a == b or (isinstance(a, float) and isinstance(b, float) and math.isnan(a) and math.isnan(b))
+
+
+def _assert_data_equal(data, expected):
+    assert set(data) == set(expected)
+    for name, values in expected.items():
+        actual = list(data[name])
+        assert len(actual) == len(values), name
+        assert all(_same(a, b) for a, b in zip(actual, list(values))), name
+
+
+# Random old -> new contents: cells changed or kept, rows appended or dropped, the column set
+# sometimes replaced; after update_source the source must hold exactly the new contents
+def test_update_source_ends_with_new_data():
+    rng = random.Random(0)
+    for _ in range(300):
+        kinds = {name: rng.choice(['float', 'int', 'str', 'factor']) for name in rng.sample('abcde', rng.randint(1, 4))}
+        n = rng.randint(0, 30)
+        old = {name: _column(rng, kind, n, rng.random() < 0.5) for name, kind in kinds.items()}
+        source = ColumnDataSource(data=old)
+
+        if rng.random() < 0.1:
+            kinds = {name: rng.choice(['float', 'str']) for name in rng.sample('abcdef', rng.randint(1, 3))}
+        m = max(0, n + rng.randint(-5, 10))
+        new = {}
+        for name, kind in kinds.items():
+            column = _column(rng, kind, m, rng.random() < 0.5)
+            if name in old and rng.random() < 0.7:  # mostly unchanged cells, as after a filter change
+                for i in range(min(n, m)):
+                    if rng.random() < 0.8:
+                        column[i] = old[name][i]
+            new[name] = column
+
+        update_source(source, new)
+        _assert_data_equal(source.data, new)
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from spatial_index import NYC_EXTENT, GridIndex
+from synthetic_data import synthetic_listings
+
+
+@pytest.fixture(scope='module')
+def listings():
+    df = synthetic_listings(20_000, seed=3)
+    df.loc[df.index[:50], 'longitude'] = -75.0  # outside the extent
+    df.loc[df.index[50:60], 'latitude'] = np.nan
+    df.loc[df.index[60], 'longitude'] = NYC_EXTENT[1]  # on the upper border
+    return df
+
+
+@pytest.fixture(scope='module')
+def grid(listings):
+    return GridIndex(listings['longitude'], listings['latitude'], values={'price': listings['price']},
+                     groups={'neighbourhood': listings['neighbourhood']}, shape=(64, 48))
+
+
+def _cells(grid, lon, lat):
+    ny, nx = grid.shape
+    x0, x1, y0, y1 = grid.extent
+    ix = np.minimum(np.floor((lon - x0) * (nx / (x1 - x0))), nx - 1).astype(np.intp)
+    iy = np.minimum(np.floor((lat - y0) * (ny / (y1 - y0))), ny - 1).astype(np.intp)
+    return iy * nx + ix
+
+
+def _inside(grid, lon, lat):
+    x0, x1, y0, y1 = grid.extent
+    return (lon >= x0) & (lon <= x1) & (lat >= y0) & (lat <= y1)
+
+
+def test_query_bbox_matches_full_scan(listings, grid):
+    lon, lat = listings['longitude'].to_numpy(), listings['latitude'].to_numpy()
+    rng = np.random.default_rng(0)
+    x0, x1, y0, y1 = NYC_EXTENT
+    boxes = [NYC_EXTENT, [-80, -70, 35, 45], [-73.9, -73.95, 40.7, 40.8], [-80, -79, 40, 41]]
+    for _ in range(200):
+        lons, lats = np.sort(rng.uniform(x0 - 0.05, x1 + 0.05, 2)), np.sort(rng.uniform(y0 - 0.05, y1 + 0.05, 2))
+        boxes.append([lons[0], lons[1], lats[0], lats[1]])
+    for lon0, lon1, lat0, lat1 in boxes:
+        with np.errstate(invalid='ignore'):
+            expected = np.flatnonzero(_inside(grid, lon, lat) & (lon >= lon0) & (lon <= lon1)
+                                      & (lat >= lat0) & (lat <= lat1))
+        np.testing.assert_array_equal(np.sort(grid.query_bbox(lon0, lon1, lat0, lat1)), expected)
+
+
+def test_group_rows_and_raster_match_full_scan(listings, grid):
+    lon, lat = listings['longitude'].to_numpy(), listings['latitude'].to_numpy()
+    with np.errstate(invalid='ignore'):
+        inside = _inside(grid, lon, lat)
+    labels = listings['neighbourhood'].to_numpy()
+    for label in list(dict.fromkeys(labels))[:20] + ['No such neighbourhood']:
+        expected = np.flatnonzero(inside & (labels == label))
+        np.testing.assert_array_equal(np.sort(grid.group_rows('neighbourhood', label)), expected)
+
+        raster = np.bincount(_cells(grid, lon[expected], lat[expected]), minlength=grid.count.size)
+        np.testing.assert_array_equal(grid.group_raster('neighbourhood', label), raster.reshape(grid.shape))
+
+
+def test_rasters_match_full_scan(listings, grid):
+    lon, lat = listings['longitude'].to_numpy(), listings['latitude'].to_numpy()
+    with np.errstate(invalid='ignore'):
+        inside = np.flatnonzero(_inside(grid, lon, lat))
+    cells = _cells(grid, lon[inside], lat[inside])
+    count = np.bincount(cells, minlength=grid.count.size).reshape(grid.shape)
+    price = np.bincount(cells, weights=listings['price'].to_numpy()[inside], minlength=grid.count.size)
+    np.testing.assert_array_equal(grid.raster(), count)
+    np.testing.assert_allclose(grid.raster('price', stat='sum'), price.reshape(grid.shape))
+    assert grid.outside == len(listings) - len(inside)
@@ -0,0 +1,16 @@
+# Directory-format entry point of the Titanic dashboards:
+#
+#   bokeh serve --show titanic_dashboard
+#   bokeh serve --show titanic_dashboard --args --dashboard   (the combined dashboard)
+#
+# Runs once per session; the data it uses is prepared once per server process
+# (see server_lifecycle.py and titanic_data.py).
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Bokeh_practical_tasks  # noqa: E402
+
+Bokeh_practical_tasks.serve_document(as_dashboard='--dashboard' in sys.argv[1:])
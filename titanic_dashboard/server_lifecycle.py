@@ -0,0 +1,12 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import titanic_data  # noqa: E402
+
+
+# Prepare the immutable Titanic frame, survival cube and scatter columns once when the server
+# starts; every session then only reads the shared objects.
+def on_server_loaded(server_context):
+    titanic_data.warm_shared()
@@ -0,0 +1,234 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from data_schema import codes, encode, encode_frame
+from fare_lod import FareLodIndex
+from instrumentation import span, traced
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+source_path = script_dir
+
+
+def prepare_data_for_processing(csv_path=None):
+
+    with span('read_csv', 'load') as info:
+        df = pd.read_csv(csv_path or source_path + '/Titanic/Titanic-Dataset.csv')
+        info['rows'] = len(df)
+
+    # Handle missing values
+    df['Age'] = df['Age'].fillna(df['Age'].median())
+    df['Cabin'] = df['Cabin'].fillna('Unknown')
+    df['Embarked'] = df['Embarked'].fillna('N/A')
+    #df.isna().sum()
+
+    age = df['Age'].to_numpy()
+    df['AgeGroup'] = np.select([age < 11, age < 20, age < 60], ['Child', 'Young Adult', 'Adult'], 'Senior')
+
+    # Sex, AgeGroup, Embarked and Pclass become categoricals in the data_schema order
+    encode_frame(df)
+
+    # Survival rate of every passenger's (Pclass, Sex, AgeGroup) group, broadcast back to the rows
+    df['SurvivalRate'] = (df.groupby(['Pclass', 'Sex', 'AgeGroup'])['Survived'].transform('mean') * 100).round(2)
+
+    return df
+
+
+# Options of the Class/Gender selectors shared by the three charts
+CLASS_OPTIONS = ["All", "1", "2", "3"]
+GENDER_OPTIONS = ["All", "male", "female"]
+
+
+# Position of every row's label in a list of selector options (-1 if it is not one of them),
+# looked up once per category and then gathered by the column's integer codes
+def _option_codes(df_survived, name, options):
+    column = encode(name, df_survived[name])
+    lookup = np.array([options.index(str(label)) if str(label) in options else -1
+                       for label in column.cat.categories] + [-1], dtype=np.intp)
+    return lookup[codes(column)]  # code -1 (missing) picks the trailing -1
+
+
+# Survivor and passenger counts for every (Pclass, Sex, AgeGroup) combination, including the
+# "All" marginals at index 0 of the class and gender axes (same order as the selectors). Every
+# widget change becomes an index lookup into these small arrays instead of a filter + groupby.
+@traced('transform')
+def build_survival_cube(df_survived):
+    age_group = encode('AgeGroup', df_survived['AgeGroup'])
+    age_groups = list(age_group.cat.categories)
+    classes, genders = CLASS_OPTIONS[1:], GENDER_OPTIONS[1:]
+
+    # One bincount over the (class, gender, age group) codes of all passengers
+    index = (_option_codes(df_survived, 'Pclass', classes), _option_codes(df_survived, 'Sex', genders), codes(age_group))
+    valid = (index[0] >= 0) & (index[1] >= 0) & (index[2] >= 0)
+    shape = (len(classes), len(genders), len(age_groups))
+    flat = np.ravel_multi_index(tuple(part[valid] for part in index), shape)
+    size = int(np.prod(shape))
+    survived = np.bincount(flat, weights=df_survived['Survived'].to_numpy()[valid], minlength=size)
+    survived = survived.astype(np.int64).reshape(shape)
+    passengers = np.bincount(flat, minlength=size).reshape(shape)
+
+    # Prepend the "All" marginals on the class and gender axes
+    def with_marginals(values):
+        values = np.concatenate([values.sum(axis=1, keepdims=True), values], axis=1)
+        return np.concatenate([values.sum(axis=0, keepdims=True), values], axis=0)
+
+    return {
+        'age_groups': age_groups,
+        'survived': with_marginals(survived),      # (4, 3, len(age_groups))
+        'passengers': with_marginals(passengers),
+    }
+
+
+# The Fare chart offers "Male"/"Female", the others "male"/"female"
+def gender_option(selected_gender):
+    return selected_gender if selected_gender == "All" else selected_gender.lower()
+
+
+def _cube_index(selected_class, selected_gender):
+    return CLASS_OPTIONS.index(selected_class), GENDER_OPTIONS.index(gender_option(selected_gender))
+
+
+# Survival rate (%) per AgeGroup for one selection, as ColumnDataSource data
+def age_group_survival_data(cube, selected_class, selected_gender):
+    i, j = _cube_index(selected_class, selected_gender)
+    survived, passengers = cube['survived'][i, j], cube['passengers'][i, j]
+    present = passengers > 0
+    return {
+        'AgeGroup': [group for group, keep in zip(cube['age_groups'], present) if keep],
+        'Survived': (survived[present] / passengers[present] * 100).tolist(),
+    }
+
+
+# Survival rate (fraction) per (Pclass, Sex) bar for one selection, as ColumnDataSource data
+def class_gender_data(cube, selected_class, selected_gender):
+    classes = CLASS_OPTIONS[1:] if selected_class == "All" else [selected_class]
+    genders = GENDER_OPTIONS[1:] if selected_gender == "All" else [selected_gender]
+    data = {'Pclass': [], 'Sex': [], 'Survival_Rate': [], 'Pclass_Sex': []}
+    for cls in classes:
+        for gender in genders:
+            i, j = _cube_index(cls, gender)
+            passengers = cube['passengers'][i, j].sum()
+            data['Pclass'].append(int(cls))
+            data['Sex'].append(gender)
+            data['Survival_Rate'].append(cube['survived'][i, j].sum() / passengers if passengers else np.nan)
+            data['Pclass_Sex'].append((cls, gender))
+    return data
+
+
+# Precomputed chart data of every (class, gender) selection, keyed "class|gender", for the
+# client-side dashboards: the whole table is shipped once and the browser only swaps entries.
+def selection_lookup(cube, data_function):
+    return {f"{selected_class}|{selected_gender}": data_function(cube, selected_class, selected_gender)
+            for selected_class in CLASS_OPTIONS for selected_gender in GENDER_OPTIONS}
+
+
+# Row positions of the passengers matching every (class, gender) selection, for the row-level
+# scatter: the update becomes a dictionary lookup plus one fancy-indexing per column.
+@traced('transform')
+def build_selection_rows(df_survived):
+    pclass = _option_codes(df_survived, 'Pclass', CLASS_OPTIONS)
+    sex = _option_codes(df_survived, 'Sex', GENDER_OPTIONS)
+    rows = {}
+    for selected_class in CLASS_OPTIONS:
+        for selected_gender in GENDER_OPTIONS:
+            mask = np.ones(len(df_survived), dtype=bool)
+            if selected_class != "All":
+                mask &= pclass == CLASS_OPTIONS.index(selected_class)
+            if selected_gender != "All":
+                mask &= sex == GENDER_OPTIONS.index(selected_gender)
+            rows[(selected_class, selected_gender)] = np.flatnonzero(mask)
+    return rows
+
+
+# Columns the Fare vs. Survival glyphs and tooltips reference; long strings such as Ticket or
+# Cabin are never drawn, so they are not serialized to the browser at all
+SCATTER_COLUMNS = ['Fare', 'Survived', 'Pclass', 'Sex', 'Age', 'Name']
+
+# The client-side dashboard re-aggregates the age group bars from the same rows
+DASHBOARD_COLUMNS = SCATTER_COLUMNS + ['AgeGroup']
+
+
+# Column arrays of the Fare vs. Survival scatter (Pclass as str for the factor colour map),
+# built without touching df_survived itself
+@traced('transform')
+def build_scatter_columns(df_survived, names=None):
+    columns = {}
+    for name in names or SCATTER_COLUMNS:
+        values = df_survived[name].astype(str) if name == 'Pclass' else df_survived[name]
+        columns[name] = values.to_numpy()
+    return columns
+
+
+# Process-wide, read-only data shared by every `bokeh serve` session. The module is imported
+# once per server process, so the CSV is parsed and aggregated once no matter how many
+# sessions run; server_lifecycle.on_server_loaded warms it before the first session arrives.
+# All numpy arrays (also those inside dicts) are flagged read-only. The frame cannot be
+# flagged, so every shared_frame() call returns a shallow copy of it: with pandas'
+# Copy-on-Write (the default since pandas 3) a session that assigns, adds or drops columns
+# changes only its own copy, and the column data is still shared until it is written.
+_shared = {}
+
+
+def _read_only(values):
+    if isinstance(values, np.ndarray):
+        values.setflags(write=False)
+    elif isinstance(values, dict):
+        for item in values.values():
+            _read_only(item)
+    return values
+
+
+def _shared_value(name, build):
+    if name not in _shared:
+        _shared[name] = _read_only(build())
+    return _shared[name]
+
+
+def _frame():
+    return _shared_value('frame', prepare_data_for_processing)
+
+
+def shared_frame():
+    return _frame().copy(deep=False)
+
+
+def shared_survival_cube():
+    return _shared_value('survival_cube', lambda: build_survival_cube(_frame()))
+
+
+def shared_selection_rows():
+    return _shared_value('selection_rows', lambda: build_selection_rows(_frame()))
+
+
+def shared_scatter_columns():
+    return _shared_value('scatter_columns', lambda: build_scatter_columns(_frame()))
+
+
+def shared_fare_lod():
+    return _shared_value('fare_lod', lambda: FareLodIndex(shared_scatter_columns(), shared_selection_rows()))
+
+
+# Build every shared object up front (called from the server lifecycle hook)
+def warm_shared():
+    _frame()
+    shared_survival_cube()
+    shared_selection_rows()
+    shared_scatter_columns()
+    shared_fare_lod()
+
+
+# Pool the server-side update computations of every session run on, created on first use.
+# It lives here because `bokeh serve Bokeh_practical_tasks.py` executes that file anew for
+# every session, while this module is imported once per server process. Threads rather than
+# processes: the computations are numpy lookups over the shared data above, which a process
+# pool would have to pickle for every call.
+_update_pool = None
+
+
+def update_pool():
+    global _update_pool
+    if _update_pool is None:
+        _update_pool = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1), thread_name_prefix='bokeh-update')
+    return _update_pool